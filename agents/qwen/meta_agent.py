@@ -68,6 +68,23 @@ class MetaAgent:
             else:
                 return next_candidates[chosen_step - 1].step
     
+    def generate_next_steps(self, max_steps: int = 1) -> list[Step]:
+        """
+        Return up to max_steps steps to execute next.
+        Independent ready branches are all returned to be executed in parallel, otherwise
+        (a single candidate, a join, or END reachable) the meta agent chooses as in generate_next_step.
+        An empty list means the meta agent skipped the current candidates, or that there is no candidate left.
+        """
+        candidates = self.plan_graph.get_next_exec_steps()
+        if not candidates:
+            return []
+        ready_nodes = self.plan_graph.get_ready_steps()
+        if max_steps > 1 and len(ready_nodes) > 1 and self.plan_graph.end_node not in candidates:
+            return [node.step for node in ready_nodes[:max_steps]]
+
+        next_step = self.generate_next_step()
+        return [next_step] if next_step else []
+
     def finalize_answer(self) -> str:
         """
         Finalizes the answer to the question by considering all previous steps and their results.
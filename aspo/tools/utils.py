@@ -1,8 +1,10 @@
-import time
-
-from openai import OpenAI
-from serpapi import GoogleSearch
 import requests
+from openai import OpenAI
+
+from web_explorer.search_cache import get_search_cache
+from web_explorer.search_api import serpapi_search
+from web_explorer.http_transport import get_transport, CircuitOpenError
+from web_explorer.summarizer import map_reduce_summarize
 
 # from dotenv import load_dotenv
 
@@ -14,7 +16,6 @@ import requests
 
 # API_KEY = os.getenv("SERP_API_KEY")
 # print(f"Using SERP API Key: {API_KEY}")
-retry_attempt = 3
 
 def get_text_search_results(query, api_key, num_results=10):
     params = {
@@ -23,36 +24,45 @@ def get_text_search_results(query, api_key, num_results=10):
         "api_key": api_key,
         "num": num_results,
     }
-    for i in range(retry_attempt):
-        try:
-            search = GoogleSearch(params)
-            # debug: 
-            # print(search.get_dict())
-            organic_results = search.get_dict().get("organic_results", [])
-            if not organic_results:
-                return (f"No results found for query: {query}")
-            parsed_results = []
-            for result in organic_results:
-                parsed_result = {
-                    "title": result.get("title"),
-                    "link": result.get("link"),
-                    "snippet": result.get("snippet"),
-                    "displayed_link": result.get("displayed_link"),
-                }
-                parsed_results.append(parsed_result)
-            return parsed_results
-        except Exception as e:
-            print(f"Attempt {i+1} failed: {e}")
-            if i < retry_attempt - 1:
-                time.sleep(2)
-            else:
-                print("All retries failed.")
-                return ("Connection error to the search engine. Please try again later.")
+
+    # Check the shared on-disk cache first
+    search_cache = get_search_cache()
+    cached_results = search_cache.get(query, params)
+    if cached_results is not None:
+        return cached_results
+    if search_cache.mode == "replay":
+        return (f"No cached results for query: {query}")
+
+    # Retries with backoff are handled by the shared HTTP transport
+    try:
+        # debug: 
+        # print(serpapi_search(params))
+        organic_results = serpapi_search(params).get("organic_results", [])
+    except Exception as e:
+        print(f"Search request failed: {e}")
+        return ("Connection error to the search engine. Please try again later.")
+
+    if not organic_results:
+        return (f"No results found for query: {query}")
+    parsed_results = []
+    for result in organic_results:
+        parsed_result = {
+            "title": result.get("title"),
+            "link": result.get("link"),
+            "snippet": result.get("snippet"),
+            "displayed_link": result.get("displayed_link"),
+        }
+        parsed_results.append(parsed_result)
+    search_cache.set(query, params, parsed_results)
+    return parsed_results
             
 def visit(url: str, api_key: str):
     request_url = "https://r.jina.ai/" + url
     headers = {"Authorization": f"Bearer {api_key}"}
-    response = requests.get(request_url, headers=headers)
+    try:
+        response = get_transport().get(request_url, target_url=url, headers=headers)
+    except (requests.RequestException, CircuitOpenError) as e:
+        raise Exception(f"Website visit error: {e}") from e
     if response.status_code == 200:
         return response.text
     else:
@@ -60,43 +70,44 @@ def visit(url: str, api_key: str):
         raise Exception(f"Website visit error: {response.status_code}")
     
 def summarize_website(content: str, api_key: str, model: str, topic: str = None):
-    # Truncate web content if too long
-    if len(content) > 20000:
-        content = content[0:20000] + "\nrest of content omitted due to length..."
+    client = OpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=api_key,
+    )
 
-    # Build up summarizing prompt
-    if topic:
-        prompt = f"""Summarize the websize content below regarding to the topic, include key URL links that may contain helpful or relevant information.
+    def summarize_once(content):
+        # Build up summarizing prompt
+        if topic:
+            prompt = f"""Summarize the websize content below regarding to the topic, include key URL links that may contain helpful or relevant information.
 Topic: {topic}
 
 Website full content:
 {content}
 """
-    else:
-        prompt = f"""Summarize the websize content below, include key URL links that may contain helpful or relevant information.
+        else:
+            prompt = f"""Summarize the websize content below, include key URL links that may contain helpful or relevant information.
 
 Website full content:
 {content}
 """
 
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key,
-    )
+        completion = client.chat.completions.create(
+            
+            # model="deepseek/deepseek-chat-v3-0324:free",
+            model = model,
+            messages=[
+                {
+                "role": "user",
+                "content": prompt
+                }
+            ]
+        )
 
-    completion = client.chat.completions.create(
-        
-        # model="deepseek/deepseek-chat-v3-0324:free",
-        model = model,
-        messages=[
-            {
-            "role": "user",
-            "content": prompt
-            }
-        ]
-    )
+        return completion.choices[0].message.content
 
-    return completion.choices[0].message.content
+    # Long content is summarized by map-reduce over its chunks most relevant to the topic,
+    # every call stays within the previous 20000 characters (~5000 tokens) prompt size
+    return map_reduce_summarize(content, topic, summarize_once, single_call_tokens=5000, chunk_tokens=5000, max_chunks=4)
 
 
 
@@ -0,0 +1,117 @@
+import os
+import base64
+import hashlib
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+from openai import OpenAI
+
+# Parsed documents are stored as <sha256 of the file>-v<parser version>.txt
+PARSED_CACHE_DIR = Path(__file__).resolve().parents[1] / "temp" / "parsed_cache"
+
+# Image captions are stored as <sha256 of the image and captioning model>.txt
+CAPTION_CACHE_DIR = Path(__file__).resolve().parents[1] / "temp" / "caption_cache"
+
+_digests = {}
+_parsed = {}
+_captions = {}
+_data_urls = {}
+_uploads = {}
+_locks = {}
+_lock = threading.Lock()
+
+
+def _key_lock(key) -> threading.Lock:
+    """
+    Lock of a cache entry, so concurrent requests for the same entry compute it once.
+    """
+    with _lock:
+        if key not in _locks:
+            _locks[key] = threading.Lock()
+        return _locks[key]
+
+
+def file_digest(file_path: str) -> str:
+    """
+    SHA-256 of the file content, computed once per (path, size, modification time).
+    """
+    stat = os.stat(file_path)
+    stamp = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if stamp not in _digests:
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(block)
+        _digests[stamp] = sha256.hexdigest()
+    return _digests[stamp]
+
+
+def _cached_text(memory: dict, key: str, cache_dir: Path, compute: Callable[[], Optional[str]]) -> Optional[str]:
+    """
+    Read-through cache of a text in memory and on disk. None results are not cached.
+    """
+    with _key_lock((str(cache_dir), key)):
+        if key in memory:
+            return memory[key]
+
+        cache_path = Path(cache_dir) / f"{key}.txt"
+        if cache_path.exists():
+            content = cache_path.read_text(encoding="utf-8")
+        else:
+            content = compute()
+            if content is None:
+                return None
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            # Write then rename, so concurrent processes never read a partial entry
+            tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(content, encoding="utf-8")
+            os.replace(tmp_path, cache_path)
+
+        memory[key] = content
+        return content
+
+
+def parse_file_cached(file_path: str, parser=None, cache_dir: Path = PARSED_CACHE_DIR) -> str:
+    """
+    DocumentParser.parse_file, cached in memory and on disk by file content and parser version.
+    Failed parses (None) are not cached.
+    """
+    from document_tools.document_parser import DocumentParser, PARSER_VERSION
+
+    key = f"{file_digest(file_path)}-v{PARSER_VERSION}"
+    return _cached_text(_parsed, key, cache_dir, lambda: (parser or DocumentParser()).parse_file(file_path))
+
+
+def caption_image_cached(image_bytes: bytes, caption: Callable[[], str], model: str = "",
+                         cache_dir: Path = CAPTION_CACHE_DIR) -> str:
+    """
+    Caption of an image, computed by caption() once per image content and captioning model.
+    """
+    key = hashlib.sha256(model.encode("utf-8") + b"\0" + image_bytes).hexdigest()
+    return _cached_text(_captions, key, cache_dir, caption)
+
+
+def upload_file_cached(openai_client: OpenAI, file_path: str, purpose: str = "user_data") -> str:
+    """
+    Upload a file to the OpenAI Files API once per process and return its file ID.
+    IDs are cached by file content, purpose and API endpoint.
+    """
+    key = (file_digest(file_path), purpose, str(openai_client.base_url))
+    with _key_lock(("upload", key)):
+        if key not in _uploads:
+            with open(file_path, "rb") as f:
+                _uploads[key] = openai_client.files.create(file=f, purpose=purpose).id
+        return _uploads[key]
+
+
+def image_data_url_cached(file_path: str) -> str:
+    """
+    Base64 data URL of an image file, encoded once per process and file content.
+    """
+    key = (file_digest(file_path), file_path.split('.')[-1])
+    if key not in _data_urls:
+        with open(file_path, "rb") as f:
+            encoded_image = base64.b64encode(f.read()).decode('utf-8')
+        _data_urls[key] = f"data:image/{key[1]};base64,{encoded_image}"
+    return _data_urls[key]
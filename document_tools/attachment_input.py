@@ -0,0 +1,51 @@
+from pathlib import Path
+from typing import Dict, List
+
+from openai import OpenAI
+
+from document_tools.attachment_cache import parse_file_cached, upload_file_cached, image_data_url_cached
+
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png"]
+
+
+def attachment_content(openai_client: OpenAI, prompt: str, file_path: str = None, include_text: bool = True,
+                       parser=None) -> List[Dict]:
+    """
+    Responses API content of a user message carrying the prompt and the task attachment.
+
+    PDFs are uploaded and referenced by file ID, images are inlined as base64 data URLs and any other
+    file is parsed to text (skipped when include_text is False). Uploads, data URLs and parsed texts
+    are cached by file content, so the planner, executors and finalizer of a task build them once.
+    The attachment goes before the prompt.
+    """
+    if not file_path:
+        return [{"type": "input_text", "text": prompt}]
+
+    ext = Path(file_path).suffix.lower()
+    if ext == ".pdf":
+        return [
+            {"type": "input_file", "file_id": upload_file_cached(openai_client, file_path)},
+            {"type": "input_text", "text": prompt},
+        ]
+    if ext in IMAGE_EXTENSIONS:
+        return [
+            {"type": "input_image", "image_url": image_data_url_cached(file_path)},
+            {"type": "input_text", "text": prompt},
+        ]
+    if not include_text:
+        return [{"type": "input_text", "text": prompt}]
+
+    file_content = parse_file_cached(file_path, parser)
+    if file_content is None:
+        file_content = f"The file {Path(file_path).name} could not be parsed."
+    return [{"type": "input_text", "text": prompt + f"\n\nFile content:\n{file_content}"}]
+
+
+def attachment_messages(openai_client: OpenAI, prompt: str, file_path: str = None, system_prompt: str = None,
+                        include_text: bool = True, parser=None) -> List[Dict]:
+    """
+    Responses API input of a request: the system prompt, then a user message with the prompt and the attachment.
+    """
+    messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+    messages.append({"role": "user", "content": attachment_content(openai_client, prompt, file_path, include_text, parser)})
+    return messages
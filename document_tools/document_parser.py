@@ -11,7 +11,10 @@ from pptx import Presentation
 from docx import Document
 from pathlib import Path
 # import subprocess
+import io
 import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 # from pdfminer.pdfparser import PDFParser
 # from pdfminer.pdfdocument import PDFDocument
 # import pdftotext
@@ -21,6 +24,14 @@ import pandas as pd
 from openai import OpenAI
 from dotenv import load_dotenv
 import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from document_tools.spreadsheet import render_spreadsheet
+from document_tools.attachment_cache import caption_image_cached
+
+# Bump when the parsed output of any file type changes, parsed attachments are cached by this version
+PARSER_VERSION = 4
 
 # Extensions that can be directly decoded by UTF-8
 UTF8_EXTENSIONS = [".txt", ".md", ".csv", ".json", ".jsonl", "jsonld", ".py"]
@@ -33,6 +44,20 @@ load_dotenv(dotenv_path=parent_env_path)
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 
+IMAGE_CAPTION_MODEL = "qwen/qwen2.5-vl-32b-instruct:free"
+
+# PDFs with fewer pages than this are parsed in-process, a worker pool would cost more than it saves
+MIN_PAGES_FOR_POOL = 32
+
+# Zip files with less content than this are parsed in-process, worker processes take seconds to start
+MIN_ZIP_BYTES_FOR_POOL = 8 * 1024 * 1024
+
+# Zip files nested deeper than this are not opened
+MAX_ZIP_DEPTH = 2
+
+# Uncompressed bytes read from a zip file (nested zip files included), larger members are skipped
+MAX_ZIP_BYTES = 512 * 1024 * 1024
+
 def encode_image(image_path: str) -> str:
     """
     Encodes an image file to a base64 string.
@@ -46,13 +71,80 @@ def encode_image(image_path: str) -> str:
     with open(image_path, "rb") as img_file:
         return base64.b64encode(img_file.read()).decode('utf-8')
 
+def _format_pdf_page(page, page_num: int, skip_tables_without_lines: bool = True) -> str:
+    """
+    Text and tables of a pdfplumber page.
+    Table detection looks for ruling lines, so pages without any line or rectangle edge are not searched for tables.
+    """
+    # Extract plain text
+    text = page.extract_text() or ""
+
+    # Extract tables
+    tables = page.extract_tables() if page.edges or not skip_tables_without_lines else []
+    table_texts = []
+    for table in tables:
+        # Convert each row into tab-separated text
+        table_rows = ["\t".join(cell if cell is not None else "" for cell in row) for row in table]
+        table_texts.append("\n".join(table_rows))
+
+    combined = f"--- Page {page_num} ---\n"
+    combined += f"\n{text.strip()}\n" if text else ""
+    if table_texts:
+        combined += "\n\n[Tables:]\n" + "\n\n".join(table_texts)
+    return combined.strip()
+
+
+def _parse_pdf_page_range(source, start: int, end: int, skip_tables_without_lines: bool = True):
+    """
+    Worker task: parse pages [start, end) of a PDF given by path or content. Returns a list of (page number, content).
+    """
+    with pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source) as pdf:
+        results = []
+        for index in range(start, end):
+            page = pdf.pages[index]
+            results.append((index + 1, _format_pdf_page(page, index + 1, skip_tables_without_lines)))
+            # Free the parsed layout of the page, page ranges of long documents would pile it up
+            page.flush_cache()
+        return results
+
+
+def _parse_member_task(name: str, data: bytes) -> str:
+    """
+    Worker task: parse a single zip member with a parser of the worker process.
+    """
+    return DocumentParser(max_workers=1).parse_zip_member(name, data)
+
+
+def _create_pool(max_workers: int) -> ProcessPoolExecutor:
+    # Spawn rather than fork: the runners are multithreaded and may hold a GPU context
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _pdf_page_ranges(num_pages: int, pages_per_task: int):
+    return [(start, min(start + pages_per_task, num_pages)) for start in range(0, num_pages, pages_per_task)]
+
+
 class DocumentParser:
-    def __init__(self):
+    def __init__(self, max_workers: int = None, pages_per_task: int = 8, skip_tables_without_lines: bool = True,
+                 caption_workers: int = 8):
+        """
+        Args:
+            max_workers: Number of worker processes used to parse the members of a zip file and the pages
+                of long PDFs (default: up to 4 CPUs). 1 parses everything in-process.
+            pages_per_task: Number of PDF pages parsed by one worker task.
+            skip_tables_without_lines: Skip table extraction on PDF pages without ruling lines,
+                where the line-based table detection finds nothing anyway.
+            caption_workers: Number of images of a presentation captioned concurrently.
+        """
         # self.excel_toolkit = ExcelToolkit()
         # self.audio_toolkit = AudioAnalysisToolkit()
         # self.video_toolkit = VideoAnalysisToolkit()
         # self.image_toolkit = ImageAnalysisToolkit()
         self.temp_dir = Path(__file__).resolve().parents[1] / "temp"
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.pages_per_task = pages_per_task
+        self.skip_tables_without_lines = skip_tables_without_lines
+        self.caption_workers = caption_workers
         self.qwen_client = OpenAI(
                                 base_url="https://openrouter.ai/api/v1",
                                 api_key=OPENROUTER_API_KEY,
@@ -76,13 +168,40 @@ class DocumentParser:
             print(f"Error parsing Excel file: {e}")
             return None
 
+    def parse_spreadsheet(self, file_path: str, data: bytes = None):
+        """
+        Renders every sheet of a workbook (.xlsx, .xlsm, .xls) or a CSV file as compact CSV with its columns
+        and their types. Rows are streamed, and large sheets are cut to their first and last rows plus a column summary.
+        With data, the spreadsheet is read from these bytes instead of file_path.
+        """
+        try:
+            return render_spreadsheet(file_path, data=data)
+        except Exception as e:
+            print(f"Error parsing spreadsheet: {e}")
+            return None
+
     def parse_image_using_qwen(self, image_path: str):
         """
         Uses Qwen model to analyze an image and return a description.
         """
-        encoded_image = encode_image(image_path)
+        with open(image_path, "rb") as img_file:
+            image_bytes = img_file.read()
+        return self.caption_image(image_bytes, str(image_path).split('.')[-1])
+
+    def caption_image(self, image_bytes: bytes, image_ext: str):
+        """
+        Describes an image given as bytes with the Qwen vision model, cached by image content.
+        """
+        return caption_image_cached(
+            image_bytes,
+            lambda: self._caption_image_using_qwen(image_bytes, image_ext),
+            model=IMAGE_CAPTION_MODEL
+        )
+
+    def _caption_image_using_qwen(self, image_bytes: bytes, image_ext: str):
+        encoded_image = base64.b64encode(image_bytes).decode('utf-8')
         completion = self.qwen_client.chat.completions.create(
-            model="qwen/qwen2.5-vl-32b-instruct:free",
+            model=IMAGE_CAPTION_MODEL,
             messages=[
                 {
                     "role": "user",
@@ -94,7 +213,7 @@ class DocumentParser:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/{image_path.split('.')[-1]};base64,{encoded_image}"
+                                "url": f"data:image/{image_ext};base64,{encoded_image}"
                             }
                         }
                     ]
@@ -104,30 +223,35 @@ class DocumentParser:
 
         return completion.choices[0].message.content
     
-    def parse_pdf(self, file_path: str):
-        page_contents = []
-
+    def iter_pdf_pages(self, file_path):
+        """
+        Yield (page number, content) for every page of a PDF (path or file-like object) as soon as it is parsed.
+        Long PDFs are parsed by page ranges in a process pool, so pages come in completion order.
+        """
         with pdfplumber.open(file_path) as pdf:
-            for page_num, page in enumerate(pdf.pages, start=1):
-                # Extract plain text
-                text = page.extract_text() or ""
-
-                # Extract tables
-                tables = page.extract_tables()
-                table_texts = []
-                for table in tables:
-                    # Convert each row into tab-separated text
-                    table_rows = ["\t".join(cell if cell is not None else "" for cell in row) for row in table]
-                    table_texts.append("\n".join(table_rows))
-
-                combined = f"--- Page {page_num} ---\n"
-                combined += f"\n{text.strip()}\n" if text else ""
-                if table_texts:
-                    combined += "\n\n[Tables:]\n" + "\n\n".join(table_texts)
-
-                page_contents.append(combined.strip())
-
-        return "\n\n".join(page_contents)
+            num_pages = len(pdf.pages)
+            if self.max_workers <= 1 or num_pages < MIN_PAGES_FOR_POOL:
+                for page_num, page in enumerate(pdf.pages, start=1):
+                    yield page_num, _format_pdf_page(page, page_num, self.skip_tables_without_lines)
+                return
+
+        # Workers open the PDF themselves, from its path or from its content
+        source = file_path
+        if hasattr(file_path, "read"):
+            file_path.seek(0)
+            source = file_path.read()
+
+        with _create_pool(self.max_workers) as executor:
+            futures = [
+                executor.submit(_parse_pdf_page_range, source, start, end, self.skip_tables_without_lines)
+                for start, end in _pdf_page_ranges(num_pages, self.pages_per_task)
+            ]
+            for future in as_completed(futures):
+                yield from future.result()
+
+    def parse_pdf(self, file_path):
+        page_contents = sorted(self.iter_pdf_pages(file_path))
+        return "\n\n".join(content for _, content in page_contents)
     
     def parse_xml(self, file_path: str):
         data = None
@@ -174,94 +298,149 @@ class DocumentParser:
     #     return content
 
     def parse_ppt(self, file_path):
-        # Implement PPT parsing logic here
+        """
+        Extracts the text of every slide and captions its pictures. Pictures are deduplicated by content
+        and the unique ones are captioned concurrently, then spliced back in slide order. Pictures whose
+        captioning fails or returns nothing get a placeholder.
+        """
         prs = Presentation(file_path)
-        # text_runs = []
-        content = []
+        # Per slide, its text lines and ("image", shape number, image hash) entries
+        slides = []
+        images = {}
 
-        for slide_num, slide in enumerate(prs.slides):
-            slide_content = f"Content of slide {slide_num}:\n"
+        for slide in prs.slides:
+            items = []
             for shape_num, shape in enumerate(slide.shapes):
                 if shape.has_text_frame:
                     for paragraph in shape.text_frame.paragraphs:
                         for run in paragraph.runs:
-                            slide_content += run.text
-                            slide_content += "\n"
+                            items.append(run.text + "\n")
                 elif shape.shape_type == 13:  # If the shape is a picture
                     image = shape.image
-                    image_bytes = image.blob
-                    image_ext = image.ext  # e.g., 'jpeg', 'png'
-
-                    filename = f"slide{slide_num+1}_img{shape_num+1}.{image_ext}"
-                    self.temp_dir.mkdir(parents=True, exist_ok=True)
-                    image_path = self.temp_dir / filename
-                    with open(image_path, "wb") as img_file:
-                        img_file.write(image_bytes)
+                    image_hash = hashlib.sha256(image.blob).hexdigest()
+                    images.setdefault(image_hash, (image.blob, image.ext))  # ext e.g., 'jpeg', 'png'
+                    items.append(("image", shape_num, image_hash))
+            slides.append(items)
+
+        captions = {}
+        if images:
+            with ThreadPoolExecutor(max_workers=min(self.caption_workers, len(images))) as executor:
+                futures = {
+                    image_hash: executor.submit(self.caption_image, image_bytes, image_ext)
+                    for image_hash, (image_bytes, image_ext) in images.items()
+                }
+                for image_hash, future in futures.items():
+                    # One failed caption only loses that image, not the whole deck
+                    try:
+                        captions[image_hash] = future.result()
+                    except Exception as e:
+                        print(f"Failed to caption image {image_hash[:12]}: {e}")
 
-                    image_content = self.parse_image_using_qwen(image_path)
-                    slide_content += f"Image {shape_num+1} content: {image_content}\n"
+        content = []
+        for slide_num, items in enumerate(slides):
+            slide_content = f"Content of slide {slide_num}:\n"
+            for item in items:
+                if isinstance(item, tuple):
+                    _, shape_num, image_hash = item
+                    caption = captions.get(image_hash) or "(image could not be captioned)"
+                    slide_content += f"Image {shape_num+1} content: {caption}\n"
+                else:
+                    slide_content += item
             content.append(slide_content)
 
         return '\n\n'.join(content)
 
-    def _unzip_file(self, zip_path: str):
-        if not zip_path.endswith(".zip"):
-            raise ValueError("Only .zip files are supported")
-
-        zip_name = os.path.splitext(os.path.basename(zip_path))[0]
-        extract_path = os.path.join(str(self.temp_dir), zip_name)
-        os.makedirs(extract_path, exist_ok=True)
-
-        # try:
-        #     subprocess.run(["unzip", "-o", zip_path, "-d", extract_path], check=True)
-        # except subprocess.CalledProcessError as e:
-        #     raise RuntimeError(f"Failed to unzip file: {e}")
-
-        # extracted_files = []
-        # for root, _, files in os.walk(extract_path):
-        #     for file in files:
-        #         extracted_files.append(os.path.join(root, file))
-
-        # return extracted_files
-
-        extracted_files = []
-
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            for member in zip_ref.namelist():
-                # Extract the member and get the full path
-                zip_ref.extract(member, path=extract_path)
-                full_path = os.path.join(extract_path, member)
-                extracted_files.append(os.path.normpath(full_path))  # Normalize for Windows
+    def _read_zip_members(self, zip_source, prefix: str = "", depth: int = 0, budget: list = None):
+        """
+        Read the members of a zip file (path or file-like object) into memory, recursing into nested zip files.
+        Returns a list of (display name, content), where content is None for a skipped member.
+        Directories are skipped, and members beyond MAX_ZIP_DEPTH or the MAX_ZIP_BYTES budget are not read.
+        """
+        budget = budget if budget is not None else [MAX_ZIP_BYTES]
+        members = []
+        with zipfile.ZipFile(zip_source, 'r') as zip_ref:
+            for info in zip_ref.infolist():
+                if info.is_dir():
+                    continue
+                # Archive paths keep same-named members of different folders apart
+                name = prefix + info.filename
+                if info.file_size > budget[0]:
+                    members.append((name, None))
+                    continue
+                budget[0] -= info.file_size
+                data = zip_ref.read(info)
+                if info.filename.endswith(".zip"):
+                    if depth + 1 < MAX_ZIP_DEPTH:
+                        members.extend(self._read_zip_members(io.BytesIO(data), f"{name}/", depth + 1, budget))
+                    else:
+                        members.append((name, None))
+                    continue
+                members.append((name, data))
+        return members
 
-        return extracted_files
-    
     def parse_zip(self, file_path: str):
         """
         Parses a zip file and returns the content of each file inside it.
+        Members are read from the archive in memory, without extraction, and nested zip files are parsed too.
+        The members of large archives, and the page ranges of long PDFs among them, are parsed in a process pool.
         """
-        extracted_files = self._unzip_file(file_path)
-        results = []
-        for file in extracted_files:
-            content = ""
-            if file.endswith(tuple(UTF8_EXTENSIONS)):
-                content = self._utf8_decode(file)
-            elif file.endswith(".xlsx") or file.endswith(".xls") or file.endswith(".xlsm"):
-                content = self.parse_excel_using_pandas(file)
-            elif file.endswith(".pptx") or file.endswith(".ppt"):
-                content = self.parse_ppt(file)
-            elif file.endswith(".jpg") or file.endswith(".png") or file.endswith(".jpeg"):
-                content = self.parse_image_using_qwen(file)
-            elif file.endswith(".pdf"):
-                content = self.parse_pdf(file)
-            elif file.endswith(".docx") or file.endswith(".doc"):
-                content = self.parse_doc(file)
-            elif file.endswith(".xml"):
-                content = self.parse_xml(file)
-            else:
-                content = f"Unsupported file type: {file}"
-            results.append({os.path.basename(file): content})
+        members = self._read_zip_members(file_path)
+        contents = [None if data is not None else "Skipped: nested too deep or over the size budget" for _, data in members]
+        pending = [i for i, (_, data) in enumerate(members) if data is not None]
+
+        pending_bytes = sum(len(members[i][1]) for i in pending)
+        if self.max_workers <= 1 or len(pending) <= 1 or pending_bytes < MIN_ZIP_BYTES_FOR_POOL:
+            for i in pending:
+                contents[i] = self.parse_zip_member(*members[i])
+        else:
+            pdf_pages = {}
+            with _create_pool(self.max_workers) as executor:
+                futures = {}
+                for i in pending:
+                    name, data = members[i]
+                    if name.endswith(".pdf"):
+                        with pdfplumber.open(io.BytesIO(data)) as pdf:
+                            num_pages = len(pdf.pages)
+                        pdf_pages[i] = []
+                        for start, end in _pdf_page_ranges(num_pages, self.pages_per_task):
+                            futures[executor.submit(_parse_pdf_page_range, data, start, end, self.skip_tables_without_lines)] = i
+                    else:
+                        futures[executor.submit(_parse_member_task, name, data)] = i
+
+                for future in as_completed(futures):
+                    i = futures[future]
+                    if i in pdf_pages:
+                        pdf_pages[i].extend(future.result())
+                    else:
+                        contents[i] = future.result()
+
+            for i, pages in pdf_pages.items():
+                contents[i] = "\n\n".join(content for _, content in sorted(pages))
+
+        results = [{name: content} for (name, _), content in zip(members, contents)]
         return json.dumps(results, indent=2)
 
+    def parse_zip_member(self, name: str, data: bytes):
+        """
+        Parses the content of a file read from a zip file, without writing it to disk.
+        """
+        if name.endswith(".xlsx") or name.endswith(".xls") or name.endswith(".xlsm") or name.endswith(".csv"):
+            return self.parse_spreadsheet(name, data)
+        elif name.endswith(tuple(UTF8_EXTENSIONS)):
+            return data.decode("utf-8")
+        elif name.endswith(".pptx") or name.endswith(".ppt"):
+            return self.parse_ppt(io.BytesIO(data))
+        elif name.endswith(".jpg") or name.endswith(".png") or name.endswith(".jpeg"):
+            return self.caption_image(data, name.split('.')[-1])
+        elif name.endswith(".pdf"):
+            return self.parse_pdf(io.BytesIO(data))
+        elif name.endswith(".docx") or name.endswith(".doc"):
+            return self.parse_doc(io.BytesIO(data))
+        elif name.endswith(".xml"):
+            return json.dumps(xmltodict.parse(data), indent=2)
+        else:
+            return f"Unsupported file type: {name}"
+
     def parse_doc(self, doc_path: str):
         """
         Parse a Word document (.docx) and extract its text content.
@@ -297,10 +476,10 @@ class DocumentParser:
         Parse a file based on its extension.
         """
         ext = Path(file_path).suffix.lower()
-        if ext in UTF8_EXTENSIONS:
+        if ext in [".xlsx", ".xls", ".xlsm", ".csv"]:
+            return self.parse_spreadsheet(file_path)
+        elif ext in UTF8_EXTENSIONS:
             return self._utf8_decode(file_path)
-        elif ext in [".xlsx", ".xls", ".xlsm", ".csv"]:
-            return self.parse_excel_using_pandas(file_path)
         elif ext in [".pptx", ".ppt"]:
             return self.parse_ppt(file_path)
         elif ext in [".jpg", ".png", ".jpeg"]:
@@ -0,0 +1,254 @@
+import io
+import re
+import csv
+import datetime
+from collections import Counter, deque
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+# Sheets whose rendered rows exceed this many characters are rendered as their first and last rows
+# plus a column summary
+MAX_RENDERED_CHARS = 40000
+
+# Distinct values tracked per text column for the summary
+MAX_DISTINCT_VALUES = 1000
+
+
+def _cell_type(value) -> str:
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return "date"
+    return "text"
+
+
+def _format_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+# Plain decimal numbers only: identifiers like 00501 or 1_000 stay text
+_CSV_NUMBER = re.compile(r"-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?")
+
+
+def _parse_csv_value(value: str):
+    """
+    Typed value of a CSV cell for column types and statistics, as for Excel sheets.
+    Cells are rendered from their original text.
+    """
+    if not _CSV_NUMBER.fullmatch(value):
+        return value
+    if value.lstrip("-").isdigit():
+        return int(value)
+    return float(value)
+
+
+def _csv_line(values: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(values)
+    return buffer.getvalue()
+
+
+class SheetRenderer:
+    """
+    Render the rows of a sheet streamed one by one, in bounded memory.
+
+    The first non-empty row is the header. Data rows are rendered as CSV while they fit in max_chars.
+    Larger sheets keep their first and last rows within that size plus a per-column summary (type,
+    number of values, min/max of numbers and dates, mean of numbers, distinct values of text).
+    With parse_value, the statistics use parse_value(cell) for text cells (numbers of CSV files),
+    while the rows are rendered from the original cells.
+    """
+
+    def __init__(self, name: str, max_chars: int = MAX_RENDERED_CHARS, parse_value: Callable[[str], object] = None):
+        self.name = name
+        self.max_chars = max_chars
+        self.parse_value = parse_value
+        self.header = None
+        self.head = []
+        self.head_chars = 0
+        self.tail = deque()
+        self.tail_chars = 0
+        self.num_rows = 0
+        self.num_columns = 0
+        self.types = []
+        self.counts = []
+        self.minimums = []
+        self.maximums = []
+        self.sums = []
+        self.distinct = []
+
+    def _grow(self, num_columns: int):
+        while len(self.types) < num_columns:
+            self.types.append(Counter())
+            self.counts.append(0)
+            self.minimums.append(None)
+            self.maximums.append(None)
+            self.sums.append(0.0)
+            self.distinct.append(set())
+
+    def add(self, row: Iterable):
+        row = list(row)
+        while row and row[-1] is None:
+            row.pop()
+        if not row:
+            return
+        self.num_columns = max(self.num_columns, len(row))
+        if self.header is None:
+            self.header = row
+            return
+
+        self.num_rows += 1
+        size = len(_csv_line([_format_cell(value) for value in row]))
+        if not self.tail and self.head_chars + size <= self.max_chars // 2:
+            self.head.append(row)
+            self.head_chars += size
+        else:
+            # Keep the last rows that fit next to the head, so sheets within max_chars are kept whole
+            self.tail.append((row, size))
+            self.tail_chars += size
+            while self.tail and self.head_chars + self.tail_chars > self.max_chars:
+                self.tail_chars -= self.tail.popleft()[1]
+
+        self._grow(len(row))
+        for i, value in enumerate(row):
+            if value is None or value == "":
+                continue
+            if self.parse_value and isinstance(value, str):
+                value = self.parse_value(value)
+            cell_type = _cell_type(value)
+            self.types[i][cell_type] += 1
+            self.counts[i] += 1
+            if cell_type in ("number", "date"):
+                try:
+                    self.minimums[i] = value if self.minimums[i] is None else min(self.minimums[i], value)
+                    self.maximums[i] = value if self.maximums[i] is None else max(self.maximums[i], value)
+                except TypeError:
+                    # Dates mixed with times or numbers mixed with dates have no order
+                    pass
+                if cell_type == "number":
+                    self.sums[i] += value
+            elif cell_type == "text" and len(self.distinct[i]) <= MAX_DISTINCT_VALUES:
+                self.distinct[i].add(value)
+
+    def _column_name(self, i: int) -> str:
+        if self.header and i < len(self.header) and self.header[i] is not None:
+            return _format_cell(self.header[i])
+        return f"Column {i + 1}"
+
+    def _column_type(self, i: int) -> str:
+        if i >= len(self.types) or not self.types[i]:
+            return "empty"
+        if len(self.types[i]) > 1:
+            return "mixed (" + ", ".join(cell_type for cell_type, _ in self.types[i].most_common()) + ")"
+        return next(iter(self.types[i]))
+
+    def _csv(self, rows: List[list]) -> str:
+        return "".join(
+            _csv_line([_format_cell(value) for value in row] + [""] * (self.num_columns - len(row)))
+            for row in rows
+        )
+
+    def render(self) -> str:
+        if self.header is None:
+            return f"## Sheet: {self.name} (empty)"
+
+        columns = [f"{self._column_name(i)} ({self._column_type(i)})" for i in range(self.num_columns)]
+        content = f"## Sheet: {self.name} ({self.num_rows} rows x {self.num_columns} columns)\n"
+        content += "Columns: " + ", ".join(columns) + "\n\n"
+        content += self._csv([self.header] + self.head)
+        omitted = self.num_rows - len(self.head) - len(self.tail)
+        if omitted:
+            content += f"... {omitted} rows omitted ...\n"
+        content += self._csv([row for row, _ in self.tail])
+
+        if omitted:
+            content += "\nColumn summary:\n"
+            for i in range(self.num_columns):
+                summary = f"- {self._column_name(i)}: {self._column_type(i)}, {self.counts[i] if i < len(self.counts) else 0} values"
+                if i < len(self.minimums) and self.minimums[i] is not None:
+                    summary += f", min {_format_cell(self.minimums[i])}, max {_format_cell(self.maximums[i])}"
+                    if self.types[i]["number"]:
+                        summary += f", mean {self.sums[i] / self.types[i]['number']:.6g}"
+                if i < len(self.distinct) and self.distinct[i]:
+                    distinct = len(self.distinct[i])
+                    summary += f", {'more than ' + str(MAX_DISTINCT_VALUES) if distinct > MAX_DISTINCT_VALUES else distinct} distinct texts"
+                content += summary + "\n"
+        return content.strip()
+
+
+def _iter_xlsx_sheets(file_path: str, data: bytes = None) -> Iterator[Tuple[str, Iterator[tuple]]]:
+    from openpyxl import load_workbook
+
+    # Read-only mode streams the rows from the file instead of loading every cell
+    workbook = load_workbook(io.BytesIO(data) if data is not None else file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            yield worksheet.title, worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _iter_xls_sheets(file_path: str, data: bytes = None) -> Iterator[Tuple[str, Iterator[tuple]]]:
+    import xlrd
+
+    workbook = xlrd.open_workbook(file_path, file_contents=data, on_demand=True)
+
+    def rows(sheet):
+        for cells in sheet.get_rows():
+            yield tuple(
+                xlrd.xldate_as_datetime(cell.value, workbook.datemode) if cell.ctype == xlrd.XL_CELL_DATE
+                else None if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK)
+                else cell.value
+                for cell in cells
+            )
+
+    try:
+        for i in range(workbook.nsheets):
+            sheet = workbook.sheet_by_index(i)
+            yield sheet.name, rows(sheet)
+            workbook.unload_sheet(i)
+    finally:
+        workbook.release_resources()
+
+
+def _iter_csv_sheets(file_path: str, data: bytes = None) -> Iterator[Tuple[str, Iterator[tuple]]]:
+    if data is not None:
+        f = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8", errors="replace", newline="")
+    else:
+        f = open(file_path, "r", encoding="utf-8", errors="replace", newline="")
+    with f:
+        yield Path(file_path).name, (tuple(value if value != "" else None for value in row) for row in csv.reader(f))
+
+
+def render_spreadsheet(file_path: str, max_chars: int = MAX_RENDERED_CHARS, data: bytes = None) -> str:
+    """
+    Render every sheet of an .xlsx/.xlsm/.xls workbook, or a .csv file, as compact CSV with its
+    schema, streaming the rows so sheets larger than max_chars are summarized in bounded memory.
+    With data, the spreadsheet is read from these bytes and file_path only gives its name and type.
+    """
+    ext = Path(file_path).suffix.lower()
+    if ext in [".xlsx", ".xlsm"]:
+        sheets = _iter_xlsx_sheets(file_path, data)
+    elif ext == ".xls":
+        sheets = _iter_xls_sheets(file_path, data)
+    elif ext == ".csv":
+        sheets = _iter_csv_sheets(file_path, data)
+    else:
+        raise ValueError(f"Unsupported spreadsheet type: {ext}")
+
+    parse_value = _parse_csv_value if ext == ".csv" else None
+    rendered = []
+    for name, rows in sheets:
+        renderer = SheetRenderer(name, max_chars=max_chars, parse_value=parse_value)
+        for row in rows:
+            renderer.add(row)
+        rendered.append(renderer.render())
+    return "\n\n".join(rendered)
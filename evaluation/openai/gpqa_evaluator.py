@@ -3,6 +3,7 @@ from typing import List
 
 from evaluation.prompts import qa_eval_prompt
 from openai import OpenAI
+from llm.backends import chat_completion
 from datasets import load_dataset
 
 class GPQAEvaluator:
@@ -18,16 +19,17 @@ class GPQAEvaluator:
         )
 
         while True:
-            response = self.client.chat.completions.create(
+            response = chat_completion(
+                self.client,
                 model=self.evaluator_model,
                 messages=[
                     {"role": "user", "content": prompt}
                 ]
             )
 
-            if "Correct" in response.choices[0].message.content:
+            if "Correct" in response:
                 return True
-            if "Incorrect" in response.choices[0].message.content:
+            if "Incorrect" in response:
                 return False
             
     def evaluate_complete_result(self, result_json_path: str) -> List[bool]:
@@ -0,0 +1,167 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Callable, Union
+
+from openai import OpenAI, AsyncOpenAI
+
+
+class LLMBackend:
+    """
+    Common interface for every chat model used by the agents.
+
+    Backends take a conversation (a list of {"role", "content"} messages) and return the text of
+    the next assistant message. They are also callable like a transformers text-generation
+    pipeline, so a backend can be passed wherever a Qwen `generator` is expected.
+    """
+
+    def generate(self, messages: List[Dict], max_new_tokens: int = 1024) -> str:
+        raise NotImplementedError("This method should be implemented by subclasses.")
+
+    def generate_batch(self, conversations: List[List[Dict]], max_new_tokens: int = 1024) -> List[str]:
+        return [self.generate(messages, max_new_tokens=max_new_tokens) for messages in conversations]
+
+    async def agenerate(self, messages: List[Dict], max_new_tokens: int = 1024) -> str:
+        return await asyncio.to_thread(self.generate, messages, max_new_tokens)
+
+    def __call__(self, messages, max_new_tokens: int = 1024, streamer=None, **kwargs):
+        # A list of conversations is a batch call
+        if messages and isinstance(messages[0], list):
+            responses = self.generate_batch(messages, max_new_tokens=max_new_tokens)
+            return [
+                [{"generated_text": conversation + [{"role": "assistant", "content": response}]}]
+                for conversation, response in zip(messages, responses)
+            ]
+
+        response = self.generate(messages, max_new_tokens=max_new_tokens)
+        return [{"generated_text": messages + [{"role": "assistant", "content": response}]}]
+
+
+class TransformersBackend(LLMBackend):
+    """
+    In-process generation with a transformers pipeline or a GenerationService wrapping one.
+    """
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.tokenizer = generator.tokenizer
+
+    def generate(self, messages: List[Dict], max_new_tokens: int = 1024) -> str:
+        return self.generator(messages, max_new_tokens=max_new_tokens)[0]["generated_text"][-1]["content"]
+
+    def generate_batch(self, conversations: List[List[Dict]], max_new_tokens: int = 1024) -> List[str]:
+        outputs = self.generator(conversations, max_new_tokens=max_new_tokens, batch_size=len(conversations))
+        return [output[0]["generated_text"][-1]["content"] for output in outputs]
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    Generation through any server exposing the OpenAI chat completions API
+    (OpenAI, OpenRouter, or a local vLLM/SGLang server doing continuous batching).
+    """
+
+    def __init__(self, model: str, base_url: str = None, api_key: str = None, max_concurrency: int = 16):
+        self.model = model
+        # Local servers usually ignore the key, but the client requires one
+        api_key = api_key or "EMPTY"
+        self.client = OpenAI(base_url=base_url, api_key=api_key)
+        self.async_client = AsyncOpenAI(base_url=base_url, api_key=api_key)
+        self.max_concurrency = max_concurrency
+
+    def generate(self, messages: List[Dict], max_new_tokens: int = 1024) -> str:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_new_tokens
+        )
+        return response.choices[0].message.content
+
+    def generate_batch(self, conversations: List[List[Dict]], max_new_tokens: int = 1024) -> List[str]:
+        # The server batches concurrent requests itself
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(lambda messages: self.generate(messages, max_new_tokens=max_new_tokens), conversations))
+
+    async def agenerate(self, messages: List[Dict], max_new_tokens: int = 1024) -> str:
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_new_tokens
+        )
+        return response.choices[0].message.content
+
+
+# Default stub response, parsed successfully by every extractor of the Qwen pipeline: a two-step plan
+# (plan graphs ignore shorter plans), plan scores, a "keep" modification, the first candidate step, a step answer
+# without any search/visit action, and a final answer after "#### "
+STUB_RESPONSE = (
+    "<think>stub</think>\n"
+    "<goal>Find the answer</goal>\n"
+    "<instruct>Answer the question directly.</instruct>\n"
+    "<goal>Check the answer</goal>\n"
+    "<instruct>Confirm the answer of the previous step.</instruct>\n"
+    "<eff>5</eff><com>5</com><exe>5</exe>\n"
+    "<action>keep</action>\n"
+    "<choose>1</choose>\n"
+    "<answer>stub response</answer>\n"
+    "#### stub response"
+)
+
+
+class StubBackend(LLMBackend):
+    """
+    Deterministic offline backend for dry runs and tests.
+    Responses are taken in order from a list (the last one repeats), or computed from the
+    conversation by a function. The default response is STUB_RESPONSE, so a full run terminates
+    without issuing any tool call.
+    """
+
+    def __init__(self, responses: Union[List[str], Callable[[List[Dict]], str]] = None):
+        self.responses = responses if responses is not None else [STUB_RESPONSE]
+        self.calls = 0
+
+    def generate(self, messages: List[Dict], max_new_tokens: int = 1024) -> str:
+        self.calls += 1
+        if callable(self.responses):
+            return self.responses(messages)
+        return self.responses[min(self.calls, len(self.responses)) - 1]
+
+
+def create_backend(backend: str, model: str = None, base_url: str = None, api_key: str = None, **kwargs) -> LLMBackend:
+    """
+    Create a backend from its config name: "transformers", "openai" or "stub".
+    For "transformers", model is the model ID or path loaded into an in-process pipeline.
+    """
+    if backend == "transformers":
+        from transformers import pipeline
+        generator = pipeline(
+            "text-generation",
+            model,
+            torch_dtype="auto",
+            device_map="auto",
+            trust_remote_code=True
+        )
+        return TransformersBackend(generator)
+    elif backend == "openai":
+        return OpenAICompatibleBackend(model=model, base_url=base_url, api_key=api_key, **kwargs)
+    elif backend == "stub":
+        return StubBackend(**kwargs)
+    else:
+        raise ValueError(f"Unknown LLM backend: {backend}")
+
+
+def chat_completion(client: Union[OpenAI, LLMBackend], messages: List[Dict], model: str = None, max_tokens: int = None) -> str:
+    """
+    Run one chat completion against either a raw OpenAI client or an LLMBackend.
+    Lets the OpenRouter call sites (summarizer, memory annotation, evaluation) accept a backend.
+    """
+    if isinstance(client, LLMBackend):
+        if max_tokens:
+            return client.generate(messages, max_new_tokens=max_tokens)
+        return client.generate(messages)
+
+    kwargs = {"max_tokens": max_tokens} if max_tokens else {}
+    response = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        **kwargs
+    )
+    return response.choices[0].message.content
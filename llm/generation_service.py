@@ -0,0 +1,123 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import List, Dict
+
+from transformers import pipeline, TextStreamer
+
+
+class GenerationRequest:
+    def __init__(self, messages: List[Dict], max_new_tokens: int = 1024, streamer: TextStreamer = None, generate_kwargs: Dict = None):
+        self.messages = messages
+        self.max_new_tokens = max_new_tokens
+        self.streamer = streamer
+        self.generate_kwargs = generate_kwargs or {}
+        self.future = Future()
+
+
+class GenerationService:
+    """
+    Shares one transformers text-generation pipeline between every Qwen call site
+    (planner, meta agent, step executor) and runs their requests in padded batches.
+
+    Requests are queued from any thread and return futures. A single worker thread owns the
+    pipeline, groups queued requests with the same generation arguments into batches of up to
+    max_batch_size, and resolves the futures with the completed conversations.
+
+    The service is callable with the same arguments as the pipeline and returns the same
+    output format, so it can be passed wherever a `generator` is expected.
+    """
+
+    def __init__(self, generator: pipeline, max_batch_size: int = 8, max_wait: float = 0.05, stream: bool = False):
+        self.generator = generator
+        self.tokenizer = generator.tokenizer
+        self.max_batch_size = max_batch_size
+        # Seconds to wait for more requests before running a partial batch
+        self.max_wait = max_wait
+        # Streaming only works for a single conversation, so it is off by default in batch mode
+        # and only applied to requests that end up alone in their batch
+        self.stream = stream
+
+        # Decoder-only models need left padding for batched generation
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        self._queue = queue.Queue()
+        self._backlog = deque()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, messages: List[Dict], max_new_tokens: int = 1024, streamer: TextStreamer = None, **generate_kwargs) -> Future:
+        """
+        Queue one conversation for generation, with extra generation arguments of the pipeline.
+        The future resolves to the conversation with the generated assistant message appended.
+        """
+        request = GenerationRequest(messages=messages, max_new_tokens=max_new_tokens, streamer=streamer, generate_kwargs=generate_kwargs)
+        self._queue.put(request)
+        return request.future
+
+    def __call__(self, messages, max_new_tokens: int = 1024, streamer: TextStreamer = None, **kwargs):
+        # The service sizes the batches itself
+        kwargs.pop("batch_size", None)
+
+        # A list of conversations is a batch call
+        if messages and isinstance(messages[0], list):
+            futures = [self.submit(conversation, max_new_tokens=max_new_tokens, **kwargs) for conversation in messages]
+            return [[{"generated_text": future.result()}] for future in futures]
+
+        return [{"generated_text": self.submit(messages, max_new_tokens=max_new_tokens, streamer=streamer, **kwargs).result()}]
+
+    def _next_request(self, timeout: float = None):
+        if self._backlog:
+            return self._backlog.popleft()
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _collect_batch(self) -> List[GenerationRequest]:
+        first = self._next_request()
+        batch = [first]
+        skipped = []
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and not self._backlog and self._queue.empty():
+                break
+            request = self._next_request(timeout=max(remaining, 0))
+            if request is None:
+                break
+            # Only requests with the same generation arguments can share a batch
+            if request.max_new_tokens == first.max_new_tokens and request.generate_kwargs == first.generate_kwargs:
+                batch.append(request)
+            else:
+                skipped.append(request)
+
+        self._backlog.extend(skipped)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                if len(batch) == 1:
+                    streamer = batch[0].streamer if self.stream else None
+                    outputs = [self.generator(batch[0].messages, max_new_tokens=batch[0].max_new_tokens, streamer=streamer, **batch[0].generate_kwargs)]
+                else:
+                    outputs = self.generator(
+                        [request.messages for request in batch],
+                        max_new_tokens=batch[0].max_new_tokens,
+                        batch_size=len(batch),
+                        **batch[0].generate_kwargs
+                    )
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            for request, output in zip(batch, outputs):
+                request.future.set_result(output[0]["generated_text"])
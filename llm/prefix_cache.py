@@ -0,0 +1,85 @@
+from typing import List, Dict
+
+import torch
+from transformers import DynamicCache, TextStreamer
+
+from llm.backends import TransformersBackend
+
+
+class PrefixCachingSession:
+    """
+    Generation for one multi-turn conversation on an in-process transformers pipeline,
+    keeping the KV cache of the conversation between turns.
+
+    Each turn of a step execution extends the previous prompt (model response, then tool outputs),
+    so only the tokens after the longest common prefix with the cached sequence are prefilled.
+    When earlier messages change (context eviction), the cache is cropped back to the common prefix.
+
+    The session is callable like the pipeline, so it can replace the `generator` of a step executor.
+    reused_tokens and new_tokens count the prompt tokens served from the cache and prefilled.
+    """
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.model = generator.model
+        self.tokenizer = generator.tokenizer
+        self._cache = None
+        self._cached_ids = []
+        self.reused_tokens = 0
+        self.new_tokens = 0
+
+    def _common_prefix_length(self, prompt_ids: List[int]) -> int:
+        length = 0
+        limit = min(len(prompt_ids), len(self._cached_ids))
+        while length < limit and prompt_ids[length] == self._cached_ids[length]:
+            length += 1
+        # The last prompt token is always fed to the model to get the logits of the next token
+        return min(length, len(prompt_ids) - 1)
+
+    def __call__(self, messages: List[Dict], max_new_tokens: int = 1024, streamer: TextStreamer = None, **kwargs):
+        prompt_ids = self.tokenizer.apply_chat_template(messages, add_generation_prompt=True, tokenize=True)
+
+        reused = self._common_prefix_length(prompt_ids) if self._cache is not None else 0
+        if reused > 0:
+            self._cache.crop(reused)
+        else:
+            self._cache = DynamicCache()
+        self.reused_tokens += reused
+        self.new_tokens += len(prompt_ids) - reused
+
+        input_ids = torch.tensor([prompt_ids], device=self.model.device)
+        with torch.no_grad():
+            output_ids = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=self._cache,
+                # Sample with the same settings as the pipeline
+                generation_config=getattr(self.generator, "generation_config", None),
+                max_new_tokens=max_new_tokens,
+                streamer=streamer
+            )
+
+        sequence = output_ids[0].tolist()
+        # The cache holds every token but the last generated one
+        self._cached_ids = sequence[:self._cache.get_seq_length()]
+        response = self.tokenizer.decode(sequence[len(prompt_ids):], skip_special_tokens=True)
+        return [{"generated_text": messages + [{"role": "assistant", "content": response}]}]
+
+    def reset(self):
+        """
+        Release the KV cache.
+        """
+        self._cache = None
+        self._cached_ids = []
+
+
+def create_prefix_session(generator):
+    """
+    A PrefixCachingSession over the pipeline of generator, or None when the generator does not run
+    an in-process model (batching GenerationService, API backends).
+    """
+    if isinstance(generator, TransformersBackend):
+        generator = generator.generator
+    if hasattr(generator, "model") and hasattr(generator, "tokenizer") and hasattr(generator.model, "generate"):
+        return PrefixCachingSession(generator)
+    return None
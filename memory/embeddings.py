@@ -0,0 +1,82 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Union
+
+import numpy as np
+
+
+class EmbeddingProvider:
+    """
+    Sentence embedding model loaded on first use.
+
+    Texts are encoded in batches with normalized embeddings, and the embeddings of the last
+    cache_size distinct texts are kept by text hash, so repeated questions and steps are free.
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", cache_size: int = 10000, batch_size: int = 64):
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self._model = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+            return self._model
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """
+        Encode one text into a vector, or a list of texts into a float32 matrix with one row per text.
+        """
+        if isinstance(texts, str):
+            return self.encode([texts])[0]
+
+        keys = [self._key(text) for text in texts]
+        embeddings = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    embeddings[key] = self._cache[key]
+
+        # Encode each missing text once, in batches
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in embeddings:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self.model.encode(
+                list(missing.values()), batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True
+            ).astype(np.float32)
+            with self._lock:
+                for key, vector in zip(missing, vectors):
+                    embeddings[key] = vector
+                    self._cache[key] = vector
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return np.stack([embeddings[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_embedding_provider(model_name: str = "all-MiniLM-L6-v2") -> EmbeddingProvider:
+    """
+    Return the process-wide embedding provider of a model, shared by all memory managers.
+    """
+    with _providers_lock:
+        if model_name not in _providers:
+            _providers[model_name] = EmbeddingProvider(model_name)
+        return _providers[model_name]
@@ -1,24 +1,48 @@
 import json
+import queue
+import atexit
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
-
-model = SentenceTransformer("all-MiniLM-L6-v2")
 
 from openai import OpenAI
 from typing import List, Tuple
 from memory.prompts import annotation_prompt
 from memory.utils import extract_experiences
 from memory.schemas import AnnotatedMemory
+from memory.vector_index import MemoryIndex
+from memory.store import MemoryStore, memory_key
+from memory.embeddings import get_embedding_provider
+from llm.backends import chat_completion
 
 class MemoryManager:
-    def __init__(self, memory: List[AnnotatedMemory], client: OpenAI, model: str = "deepseek/deepseek-chat-v3.1:free"):
+    def __init__(self, memory: List[AnnotatedMemory], client: OpenAI, model: str = "deepseek/deepseek-chat-v3.1:free", ann_threshold: int = 50000,
+                 embedding_model: str = "all-MiniLM-L6-v2", annotation_workers: int = 4, annotation_batch_size: int = 8,
+                 annotation_wait: float = 0.5):
         self.memory = memory
         self.client = client
         self.model = model
-
-    def add(self, question: str, step: str, actions: list, result: str, reference: str) -> AnnotatedMemory:
+        # Loaded on first encode and shared by every MemoryManager of the process
+        self.embedder = get_embedding_provider(embedding_model)
+        # Embedding matrices of self.memory, synced on retrieval (entries are only ever appended)
+        self.index = MemoryIndex(ann_threshold=ann_threshold)
+        # Write-behind annotation queue of add_async, served by a worker thread started on first use
+        self.annotation_workers = annotation_workers
+        self.annotation_batch_size = annotation_batch_size
+        self.annotation_wait = annotation_wait
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.RLock()
+
+    def _sync_index(self):
+        if self.index.size > len(self.memory):
+            self.index.clear()
+        new_entries = self.memory[self.index.size:]
+        if new_entries:
+            self.index.add([m.question_emb for m in new_entries], [m.step_emb for m in new_entries])
+
+    def _annotate(self, question: str, step: str, actions: list, result: str, reference: str) -> List[str]:
         # build up user prompt
         user_prompt = f"Question: {question}\n\nThe executed step: {step}\n\nExecution history:\n"
         for a in actions:
@@ -30,7 +54,8 @@ class MemoryManager:
 
         # get annotation
         print(f"Summarizing experiences for execution of the step: {step}...")
-        completion = self.client.chat.completions.create(
+        response = chat_completion(
+            self.client,
             model=self.model,
             messages=[
                 {
@@ -44,31 +69,118 @@ class MemoryManager:
             ]
         )
 
-        experiences = extract_experiences(completion.choices[0].message.content)
+        experiences = extract_experiences(response)
 
         exp_str = '\n'.join(experiences)
         print(f"Summarized experiences:\n{exp_str}")
+        return experiences
 
-        # find if step exists in memory
-        question_emb = None
-        for annotation in self.memory:
-            if annotation.question == question:
-                question_emb = annotation.question_emb
-                if annotation.step == step:
-                    # step_emb = annotation.step_emb
-                    annotation.experiences.append(experiences)
-                    print("Experiences added in memory")
-                    return annotation
-
-        step_emb = model.encode(step, normalize_embeddings=True)
-        # find if question exists in the memory
-        if not question_emb:
-            question_emb = model.encode(question, normalize_embeddings=True)
-
-        annotation = AnnotatedMemory(question=question, step=step, experiences=experiences, question_emb=question_emb, step_emb=step_emb)
-        self.memory.append(annotation)
-        print("Experiences added in memory")
-        return annotation
+    def _commit(self, annotated: List[Tuple[str, str, List[str]]]) -> List[AnnotatedMemory]:
+        """
+        Add (question, step, experiences) tuples to memory, embedding all new entries in one batch.
+        """
+        with self._lock:
+            existing = {memory_key(m.question, m.step): m for m in self.memory}
+            new_entries = {}
+            for question, step, experiences in annotated:
+                key = memory_key(question, step)
+                if key in existing:
+                    # the step exists in memory
+                    annotation = existing[key]
+                    annotation.experiences = list(dict.fromkeys(annotation.experiences + experiences))
+                else:
+                    previous = new_entries[key][2] if key in new_entries else []
+                    new_entries[key] = (question, step, list(dict.fromkeys(previous + experiences)))
+
+            if new_entries:
+                # embeddings of repeated questions come from the embedding cache
+                entries = list(new_entries.values())
+                embeddings = self.embedder.encode([e[0] for e in entries] + [e[1] for e in entries])
+                for i, (question, step, experiences) in enumerate(entries):
+                    annotation = AnnotatedMemory(question=question, step=step, experiences=experiences,
+                                                 question_emb=embeddings[i], step_emb=embeddings[len(entries) + i])
+                    existing[memory_key(question, step)] = annotation
+                    self.memory.append(annotation)
+
+            annotations = [existing[memory_key(question, step)] for question, step, _ in annotated]
+
+        print(f"{len(annotations)} experiences added in memory")
+        return annotations
+
+    def add(self, question: str, step: str, actions: list, result: str, reference: str) -> AnnotatedMemory:
+        experiences = self._annotate(question, step, actions, result, reference)
+        return self._commit([(question, step, experiences)])[0]
+
+    def add_async(self, question: str, step: str, actions: list, result: str, reference: str):
+        """
+        Queue a step execution for annotation off the critical path.
+        A background worker annotates queued executions concurrently and commits them in batches,
+        call flush() to wait for them (done automatically at interpreter shutdown).
+        """
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._annotation_worker, daemon=True)
+                self._worker.start()
+                atexit.register(self.flush)
+        self._queue.put((question, step, actions, result, reference))
+
+    def flush(self):
+        """
+        Annotate and commit every queued execution on the calling thread, then wait for the batch
+        the worker may be processing. Safe at interpreter shutdown, when thread pools no longer accept work.
+        """
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            self._process_batch(batch)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+        self._queue.join()
+
+    def _process_batch(self, batch: list, executor: ThreadPoolExecutor = None):
+        """
+        Annotate queued executions (concurrently with an executor) and commit them in one batch.
+        """
+        if not batch:
+            return
+        try:
+            futures = [executor.submit(self._annotate, *item) for item in batch] if executor else None
+        except RuntimeError:
+            # The pool is shut down at interpreter exit, annotate on this thread instead
+            futures = None
+
+        annotated = []
+        for i, item in enumerate(batch):
+            try:
+                experiences = futures[i].result() if futures else self._annotate(*item)
+                annotated.append((item[0], item[1], experiences))
+            except Exception as e:
+                print(f"Failed to annotate the execution of the step {item[1]}: {e}")
+        try:
+            if annotated:
+                self._commit(annotated)
+        except Exception as e:
+            print(f"Failed to add experiences in memory: {e}")
+
+    def _annotation_worker(self):
+        with ThreadPoolExecutor(max_workers=self.annotation_workers) as executor:
+            while True:
+                batch = [self._queue.get()]
+                try:
+                    while len(batch) < self.annotation_batch_size:
+                        try:
+                            batch.append(self._queue.get(timeout=self.annotation_wait))
+                        except queue.Empty:
+                            break
+                    self._process_batch(batch, executor)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
 
     def retrieve(
         self,
@@ -86,101 +198,83 @@ class MemoryManager:
             return []
 
         # Compute embeddings for query
-        # Assuming self.model has an encode method for embeddings
-        question_emb = self.model.encode(question, normalize_embeddings=True)
-        step_emb = self.model.encode(step, normalize_embeddings=True)
-
-        results = []
-
-        for annotation in self.memory:
-            # Compute cosine similarity separately
-            sim_q = cosine_similarity(
-                question_emb.reshape(1, -1),
-                annotation.question_emb.reshape(1, -1)
-            )[0][0]
-
-            sim_s = cosine_similarity(
-                step_emb.reshape(1, -1),
-                annotation.step_emb.reshape(1, -1)
-            )[0][0]
-
-            # Weighted combination
-            score = alpha * sim_q + (1 - alpha) * sim_s
-            results.append((annotation, score))
-
-        # Sort by similarity descending
-        results.sort(key=lambda x: x[1], reverse=True)
+        question_emb, step_emb = self.embedder.encode([question, step])
 
-        return results[:topk]
+        # Weighted combination of question and step similarities over all entries at once
+        with self._lock:
+            self._sync_index()
+            return [(self.memory[i], score) for i, score in self.index.search(question_emb, step_emb, alpha=alpha, topk=topk)]
     
     def serialize(self, path: str = './'):
         """
-        Serialize current memory into the specified path as 'memory.json'.
+        Serialize current memory into the memory store 'memory_store' under the specified path.
+        Only new entries and changed experiences are written.
         """
 
-        path = Path(path)
-        path.mkdir(parents=True, exist_ok=True)  # ensure directory exists
-
-        memory_file = path / "memory.json"
-
-        # Convert AnnotatedMemory objects to dicts
-        memory_list = []
-        for mem in self.memory:
-            memory_list.append({
-                "memory_id": getattr(mem, "memory_id", None),  # optional if you have it
-                "question": mem.question,
-                "step": mem.step,
-                "experiences": mem.experiences,
-                "question_emb": mem.question_emb,
-                "step_emb": mem.step_emb
-            })
+        store_path = Path(path) / "memory_store"
+        store = MemoryStore(store_path)
+        with self._lock:
+            store.save(self.memory)
+        store.close()
 
-        # Write to file
-        with memory_file.open("w", encoding="utf-8") as f:
-            json.dump(memory_list, f, ensure_ascii=False, indent=2)
-
-        print(f"Memory serialized to {memory_file}")
+        print(f"Memory serialized to {store_path}")
 
     def load(self, path: str):
         """
-        Load memory from a JSON file at the given path.
+        Load memory from a memory store directory, or from a legacy JSON file at the given path.
+        Entries with an already known (question, step) have their experiences merged.
         """
 
         path = Path(path)
         if not path.exists():
             raise FileNotFoundError(f"No such file: {path}")
 
-        # Step 1: load JSON from path
-        with path.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        if not isinstance(data, list):
-            raise ValueError("Loaded JSON must be a list of AnnotatedMemory entries")
-
-        # Step 2: process each loaded memory
-        for mem_dict in data:
-            # Convert dict to AnnotatedMemory instance
-            mem_entry = AnnotatedMemory(
-                question=mem_dict["question"],
-                step=mem_dict["step"],
-                experiences=mem_dict.get("experiences", []),
-                question_emb=mem_dict["question_emb"],
-                step_emb=mem_dict["step_emb"]
-            )
-
-            # Check if same question + step already exists
-            existing = None
-            for m in self.memory:
-                if m.question == mem_entry.question and m.step == mem_entry.step:
-                    existing = m
-                    break
-
-            if existing:
-                # Merge experiences, remove duplicates
-                combined = list(set(existing.experiences + mem_entry.experiences))
-                existing.experiences = combined
-            else:
-                # Add new memory
-                self.memory.append(mem_entry)
-
-        print(f"Loaded {len(data)} memory entries from {path}")
\ No newline at end of file
+        # Step 1: load entries from path
+        matrices = None
+        if path.is_dir():
+            store = MemoryStore(path)
+            entries = store.load()
+            matrices = store.embedding_matrices()
+            store.close()
+        else:
+            with path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+
+            if not isinstance(data, list):
+                raise ValueError("Loaded JSON must be a list of AnnotatedMemory entries")
+
+            entries = [
+                AnnotatedMemory(
+                    question=mem_dict["question"],
+                    step=mem_dict["step"],
+                    experiences=mem_dict.get("experiences", []),
+                    question_emb=mem_dict["question_emb"],
+                    step_emb=mem_dict["step_emb"]
+                )
+                for mem_dict in data
+            ]
+
+        # Step 2: merge into memory, deduplicating on the hash of (question, step)
+        with self._lock:
+            index_in_sync = self.index.size == len(self.memory)
+            existing = {memory_key(m.question, m.step): m for m in self.memory}
+            new_rows = []
+            for row, mem_entry in enumerate(entries):
+                key = memory_key(mem_entry.question, mem_entry.step)
+                if key in existing:
+                    # Merge experiences, remove duplicates
+                    existing[key].experiences = list(dict.fromkeys(existing[key].experiences + mem_entry.experiences))
+                else:
+                    # Add new memory
+                    self.memory.append(mem_entry)
+                    existing[key] = mem_entry
+                    new_rows.append(row)
+
+            # Index the embedding matrices of a store directly instead of stacking them entry by entry
+            if matrices is not None and index_in_sync and new_rows:
+                question_embs, step_embs = matrices
+                if len(new_rows) < len(entries):
+                    question_embs, step_embs = question_embs[new_rows], step_embs[new_rows]
+                self.index.add(question_embs, step_embs)
+
+        print(f"Loaded {len(entries)} memory entries from {path}")
@@ -0,0 +1,130 @@
+import json
+import sqlite3
+import hashlib
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+from memory.schemas import AnnotatedMemory
+
+
+def memory_key(question: str, step: str) -> str:
+    return hashlib.sha256(f"{question}\n{step}".encode("utf-8")).hexdigest()
+
+
+class MemoryStore:
+    """
+    On-disk experience memory store.
+
+    A store is a directory holding:
+    - records.sqlite: question, step and experiences of every entry, keyed by the hash of (question, step).
+      The row id of an entry is its row in the embedding files.
+    - question_emb.f32 / step_emb.f32: raw float32 embedding matrices, appended to and read back memory-mapped.
+
+    Saving only appends the embeddings of new entries and rewrites the experiences that changed.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.question_file = self.path / "question_emb.f32"
+        self.step_file = self.path / "step_emb.f32"
+
+        self._conn = sqlite3.connect(str(self.path / "records.sqlite"))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS memories ("
+            "row INTEGER PRIMARY KEY, key TEXT UNIQUE, question TEXT, step TEXT, experiences TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    @property
+    def dim(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+
+    def _embeddings(self, file: Path, count: int) -> np.ndarray:
+        if count == 0:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(file, dtype=np.float32, mode="r", shape=(count, self.dim))
+
+    def embedding_matrices(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Memory-mapped question and step embedding matrices, row i belonging to the i-th loaded entry.
+        """
+        count = len(self)
+        return self._embeddings(self.question_file, count), self._embeddings(self.step_file, count)
+
+    def load(self) -> List[AnnotatedMemory]:
+        """
+        Load every entry. The embeddings are rows of the memory-mapped embedding files.
+        """
+        rows = self._conn.execute("SELECT row, question, step, experiences FROM memories ORDER BY row").fetchall()
+        question_embs, step_embs = self.embedding_matrices()
+
+        # Entries come from our own files: skip validating every float, and keep the embeddings
+        # as float32 rows instead of converting them to lists
+        return [
+            AnnotatedMemory.model_construct(
+                question=question,
+                step=step,
+                experiences=json.loads(experiences),
+                question_emb=question_embs[row],
+                step_emb=step_embs[row],
+            )
+            for row, question, step, experiences in rows
+        ]
+
+    def save(self, memory: List[AnnotatedMemory]):
+        """
+        Persist memory incrementally: new (question, step) entries are appended,
+        the experiences of known entries are updated when they changed.
+        """
+        known = {
+            key: (row, experiences)
+            for row, key, experiences in self._conn.execute("SELECT row, key, experiences FROM memories")
+        }
+        next_row = len(known)
+
+        new_records = []
+        new_memories = []
+        updates = []
+        for mem in memory:
+            key = memory_key(mem.question, mem.step)
+            experiences = json.dumps(mem.experiences, ensure_ascii=False)
+            if key in known:
+                row, stored_experiences = known[key]
+                if stored_experiences != experiences:
+                    updates.append((experiences, row))
+                    known[key] = (row, experiences)
+            else:
+                new_records.append((next_row, key, mem.question, mem.step, experiences))
+                new_memories.append(mem)
+                known[key] = (next_row, experiences)
+                next_row += 1
+
+        if new_records:
+            question_embs = np.asarray([np.asarray(m.question_emb, dtype=np.float32) for m in new_memories])
+            step_embs = np.asarray([np.asarray(m.step_emb, dtype=np.float32) for m in new_memories])
+            if self.dim is None:
+                self._conn.execute("INSERT INTO meta (name, value) VALUES ('dim', ?)", (str(question_embs.shape[1]),))
+            # Embeddings first: a crash leaves unreferenced rows at most, which the next append overwrites
+            offset = new_records[0][0] * self.dim * 4
+            for file, embs in [(self.question_file, question_embs), (self.step_file, step_embs)]:
+                with open(file, "r+b" if file.exists() else "wb") as f:
+                    f.seek(offset)
+                    f.write(embs.tobytes())
+                    f.truncate()
+            self._conn.executemany(
+                "INSERT INTO memories (row, key, question, step, experiences) VALUES (?, ?, ?, ?, ?)", new_records
+            )
+        if updates:
+            self._conn.executemany("UPDATE memories SET experiences = ? WHERE row = ?", updates)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
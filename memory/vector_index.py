@@ -0,0 +1,126 @@
+import numpy as np
+from typing import List, Tuple
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class MemoryIndex:
+    """
+    Embedding matrices of the memory entries for fast weighted-similarity retrieval.
+
+    Question and step embeddings are kept L2-normalized in contiguous float32 matrices that grow
+    by doubling their capacity, so the score of every entry,
+        alpha * cos(question, q) + (1 - alpha) * cos(step, s),
+    is two matrix-vector products followed by an argpartition top-k.
+
+    Once the index holds at least ann_threshold entries and hnswlib is installed, an HNSW index
+    over the concatenation [sqrt(alpha) * question, sqrt(1 - alpha) * step] is used instead:
+    its inner product is exactly the weighted score above. The HNSW index is built per alpha.
+    """
+
+    def __init__(self, dim: int = None, ann_threshold: int = 50000, ef_search: int = 128):
+        self.dim = dim
+        self.ann_threshold = ann_threshold
+        self.ef_search = ef_search
+        self.size = 0
+        self._questions = None
+        self._steps = None
+        self._ann = None
+        self._ann_alpha = None
+        self._ann_size = 0
+
+    @property
+    def question_matrix(self) -> np.ndarray:
+        return self._questions[:self.size]
+
+    @property
+    def step_matrix(self) -> np.ndarray:
+        return self._steps[:self.size]
+
+    def _reserve(self, capacity: int):
+        if self._questions is not None and capacity <= len(self._questions):
+            return
+        new_capacity = max(capacity, 2 * (len(self._questions) if self._questions is not None else 512))
+        questions = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        steps = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        if self.size:
+            questions[:self.size] = self._questions[:self.size]
+            steps[:self.size] = self._steps[:self.size]
+        self._questions, self._steps = questions, steps
+
+    def add(self, question_embs, step_embs):
+        """
+        Append the embeddings of new entries, one row per entry.
+        """
+        question_embs = normalize_rows(np.atleast_2d(np.asarray(question_embs, dtype=np.float32)))
+        step_embs = normalize_rows(np.atleast_2d(np.asarray(step_embs, dtype=np.float32)))
+        if len(question_embs) == 0:
+            return
+        if self.dim is None:
+            self.dim = question_embs.shape[1]
+
+        self._reserve(self.size + len(question_embs))
+        self._questions[self.size:self.size + len(question_embs)] = question_embs
+        self._steps[self.size:self.size + len(step_embs)] = step_embs
+        self.size += len(question_embs)
+
+    def clear(self):
+        self.size = 0
+        self._ann = None
+        self._ann_size = 0
+
+    def _combined(self, questions: np.ndarray, steps: np.ndarray, alpha: float) -> np.ndarray:
+        return np.hstack([np.sqrt(alpha) * questions, np.sqrt(1 - alpha) * steps]).astype(np.float32)
+
+    def _get_ann(self, alpha: float):
+        """
+        Return an HNSW index in sync with the entries for this alpha, or None when unavailable.
+        """
+        if self.size < self.ann_threshold:
+            return None
+        try:
+            import hnswlib
+        except ImportError:
+            return None
+
+        if self._ann is None or self._ann_alpha != alpha:
+            self._ann = hnswlib.Index(space="ip", dim=2 * self.dim)
+            self._ann.init_index(max_elements=2 * self.size, ef_construction=200, M=16)
+            self._ann_alpha = alpha
+            self._ann_size = 0
+        if self._ann_size < self.size:
+            if self.size > self._ann.get_max_elements():
+                self._ann.resize_index(2 * self.size)
+            new_rows = self._combined(self._questions[self._ann_size:self.size], self._steps[self._ann_size:self.size], alpha)
+            self._ann.add_items(new_rows, np.arange(self._ann_size, self.size))
+            self._ann_size = self.size
+        self._ann.set_ef(max(self.ef_search, 1))
+        return self._ann
+
+    def search(self, question_emb, step_emb, alpha: float = 0.7, topk: int = 3) -> List[Tuple[int, float]]:
+        """
+        Return (entry index, score) of the topk entries, best first.
+        """
+        if self.size == 0 or topk <= 0:
+            return []
+        question_emb = normalize_rows(np.asarray(question_emb, dtype=np.float32).reshape(-1))
+        step_emb = normalize_rows(np.asarray(step_emb, dtype=np.float32).reshape(-1))
+        topk = min(topk, self.size)
+
+        ann = self._get_ann(alpha)
+        if ann is not None:
+            ann.set_ef(max(self.ef_search, topk))
+            labels, distances = ann.knn_query(self._combined(question_emb[None], step_emb[None], alpha), k=topk)
+            # hnswlib reports inner product distances as 1 - score
+            return [(int(label), float(1 - distance)) for label, distance in zip(labels[0], distances[0])]
+
+        scores = alpha * (self.question_matrix @ question_emb) + (1 - alpha) * (self.step_matrix @ step_emb)
+        if topk < self.size:
+            top = np.argpartition(-scores, topk - 1)[:topk]
+        else:
+            top = np.arange(self.size)
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
@@ -1,54 +1,137 @@
+import re
+import hashlib
+import threading
 from collections import deque
+from difflib import SequenceMatcher
+from typing import Callable, List
+
+import numpy as np
 
 from tree_search.schemas import Plan, Step
 
+
+def normalize_step_text(text: str) -> str:
+    """
+    Lowercase, collapse whitespace and drop trailing punctuation, so trivially different
+    spellings of the same step share an index key.
+    """
+    return re.sub(r"\s+", " ", text).strip().lower().rstrip(".!;:")
+
+
+def step_key(step: Step) -> str:
+    return hashlib.sha1(
+        f"{normalize_step_text(step.goal)}\n{normalize_step_text(step.instructions)}".encode("utf-8")
+    ).hexdigest()
+
+
 class StepNode:
     def __init__(self, step: Step):
         self.step = step
-        self.children = []
-        # self.parent = None
+        # Insertion-ordered sets (dicts with None values) for O(1) membership checks
+        self.children = {}
+        self.parents = {}
         self.execution_result = None
-        
+
+    def add_child(self, node: "StepNode"):
+        self.children[node] = None
+        node.parents[self] = None
+
 
 class PlanGraph:
-    def __init__(self):
+    """
+    Graph of steps merged from several plans.
+
+    Steps are looked up through a dict keyed by the hash of their normalized goal and instructions.
+    With a similarity_threshold, a step without an exact match is additionally merged into the most
+    similar existing step scoring at least the threshold: cosine similarity of embed_fn embeddings
+    when an embedding function (list of texts -> list of vectors) is given, a lexical ratio otherwise.
+    """
+
+    def __init__(self, similarity_threshold: float = None, embed_fn: Callable[[List[str]], List[List[float]]] = None):
         self.start_node = StepNode(step=Step(goal="START", instructions="START"))
         self.start_node.execution_result = "Started the execution"
         self.end_node = StepNode(step=Step(goal="END", instructions="END"))
         self.node_list = [self.start_node, self.end_node]
+        self.similarity_threshold = similarity_threshold
+        self.embed_fn = embed_fn
+        self._index = {step_key(node.step): node for node in self.node_list}
+        self._embeddings = {}
+        # Guards execution result write-backs from concurrently executed branches
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _step_text(step: Step) -> str:
+        return f"{normalize_step_text(step.goal)}\n{normalize_step_text(step.instructions)}"
+
+    def _embed(self, nodes: List[StepNode]):
+        missing = [node for node in nodes if node not in self._embeddings]
+        if missing:
+            vectors = np.asarray(self.embed_fn([self._step_text(node.step) for node in missing]), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+            for node, vector in zip(missing, vectors):
+                self._embeddings[node] = vector
+        return np.stack([self._embeddings[node] for node in nodes])
+
+    def find_similar_step(self, step: Step, exclude: set = None):
+        """
+        Return the existing node most similar to step if it reaches the similarity threshold, otherwise None.
+        """
+        candidates = [node for node in self.node_list[2:] if not exclude or node not in exclude]
+        if self.similarity_threshold is None or not candidates:
+            return None
+
+        if self.embed_fn:
+            query = np.asarray(self.embed_fn([self._step_text(step)])[0], dtype=np.float32)
+            query /= np.linalg.norm(query) + 1e-12
+            scores = self._embed(candidates) @ query
+        else:
+            text = self._step_text(step)
+            scores = [SequenceMatcher(None, text, self._step_text(node.step)).ratio() for node in candidates]
+
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            return candidates[best]
+        return None
 
     def exist_step(self, step: Step):
-        for node in self.node_list:
-            if node.step == step:
-                return node
-        return None
-    
+        node = self._index.get(step_key(step))
+        if node is None:
+            node = self.find_similar_step(step)
+        return node
+
+    def _get_or_create_node(self, step: Step, plan_nodes: set):
+        key = step_key(step)
+        node = self._index.get(key)
+        if node is None:
+            # Never merge two steps of the same plan, that would create a cycle
+            node = self.find_similar_step(step, exclude=plan_nodes)
+        created = node is None
+        if created:
+            node = StepNode(step=step)
+            self.node_list.append(node)
+        # Merged steps are indexed under their own key too, so later lookups stay O(1)
+        self._index.setdefault(key, node)
+        plan_nodes.add(node)
+        return node, created
 
     def add_plan(self, plan: Plan):
-        for i in range(len(plan.steps) - 1):
-            cur_step = plan.steps[i]
-            next_step = plan.steps[i + 1]
-
-            # Get or create current node
-            cur_node = self.exist_step(cur_step)
-            if not cur_node:
-                cur_node = StepNode(step=cur_step)
-                self.node_list.append(cur_node)
-                if i == 0:
-                    self.start_node.children.append(cur_node)
-
-
-            # Get or create next node
-            next_node = self.exist_step(next_step)
-            if not next_node:
-                next_node = StepNode(step=next_step)
-                self.node_list.append(next_node)
-                if i == (len(plan.steps) - 2):
-                    next_node.children.append(self.end_node)
-
-            # Add next_node as a child if not already linked
-            if next_node not in cur_node.children:
-                cur_node.children.append(next_node)
+        if len(plan.steps) < 2:
+            return
+
+        # Get or create the node of every step
+        plan_nodes = set()
+        nodes = [self._get_or_create_node(step, plan_nodes) for step in plan.steps]
+
+        first_node, created = nodes[0]
+        if created:
+            self.start_node.add_child(first_node)
+        last_node, created = nodes[-1]
+        if created:
+            last_node.add_child(self.end_node)
+
+        # Link consecutive steps, linking is idempotent
+        for (cur_node, _), (next_node, _) in zip(nodes, nodes[1:]):
+            cur_node.add_child(next_node)
 
     def add_plan_list(self, plan_list: list[Plan]):
         for plan in plan_list:
@@ -87,6 +170,34 @@ class PlanGraph:
 
         return next_exec_nodes
     
+    def get_parents(self, node: StepNode):
+        return list(node.parents)
+
+    def get_ready_steps(self):
+        """
+        Get the frontier steps whose predecessors are all executed.
+        Such steps don't depend on each other, so they can be executed in parallel.
+        END is never returned, joining the branches is left to the meta agent.
+        """
+        ready_nodes = []
+        for node in self.get_next_exec_steps():
+            if node is self.end_node:
+                continue
+            if all(parent.execution_result is not None for parent in self.get_parents(node)):
+                ready_nodes.append(node)
+        return ready_nodes
+
+    def set_execution_results(self, results: list[tuple[Step, str]]):
+        """
+        Write back the execution results of several steps at once, so readers never see
+        a partially updated batch of parallel branches.
+        """
+        with self._lock:
+            for step, execution_result in results:
+                node = self.exist_step(step)
+                if node:
+                    node.execution_result = execution_result
+
     def get_current_exec_results(self):
         """
         Get all the current execution results.
@@ -95,10 +206,11 @@ class PlanGraph:
         results = []
 
         # Traverse all nodes in the plan graph
-        for node in self.node_list:
-            # Add step and its execution result if available (excluding START/END)
-            if node.execution_result is not None and node.step.goal not in ["START", "END"]:
-                results.append((node.step, node.execution_result))
+        with self._lock:
+            for node in self.node_list:
+                # Add step and its execution result if available (excluding START/END)
+                if node.execution_result is not None and node.step.goal not in ["START", "END"]:
+                    results.append((node.step, node.execution_result))
 
         return results
     
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+from tree_search.schemas import Step
+from plan_merger.base import PlanGraph
+
+
+def execute_steps_in_parallel(plan_graph: PlanGraph, steps: List[Step], run_step: Callable[[Step, List[Tuple[Step, str]]], dict], max_workers: int = 4) -> List[dict]:
+    """
+    Execute mutually independent steps (see PlanGraph.get_ready_steps) on a bounded worker pool.
+
+    Every step sees the same finished steps, taken before the batch starts. The results of the
+    successful steps are written back to the plan graph together once the whole batch is done,
+    failed steps keep no execution result so they are scheduled again.
+
+    Args:
+        plan_graph: The plan graph the steps belong to
+        steps: Steps to execute
+        run_step: Executes one step given the finished steps and returns its step results dict
+        max_workers: Maximum number of steps executed at the same time
+
+    Returns:
+        The step results in the order of steps, a failed step gets an error entry
+    """
+    finished_steps = plan_graph.get_current_exec_results()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(steps)))) as executor:
+        futures = [executor.submit(run_step, step, finished_steps) for step in steps]
+
+    step_results = []
+    execution_results = []
+    for step, future in zip(steps, futures):
+        try:
+            step_result = future.result()
+            execution_results.append((step, step_result.get('result', '')))
+        except Exception as e:
+            step_result = {
+                "goal": step.goal,
+                "result": f"Step failed with error: {str(e)}",
+                "error": str(e),
+                "status": "failed"
+            }
+        step_results.append(step_result)
+
+    plan_graph.set_execution_results(execution_results)
+    return step_results
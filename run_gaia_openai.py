@@ -31,6 +31,10 @@ if __name__ == "__main__":
     parser.add_argument("--planner_model", type=str, default="gpt-4o-mini", help="The model to use for planning.")
     parser.add_argument("--meta_model", type=str, default="gpt-4o-mini", help="The model to use for meta reasoning.")
     parser.add_argument("--executor_model", type=str, default="gpt-4o-mini", help="The model to use for executing the plan.")
+    parser.add_argument("--merge_threshold", type=float, default=None, help="Also merge near-identical steps of different plans whose similarity reaches this threshold (0-1).")
+    parser.add_argument("--concurrent_tools", action="store_true", help="Let the step executor run several search/visit actions per turn concurrently.")
+    parser.add_argument("--visit_mode", type=str, default="summarize", choices=["summarize", "extract", "rerank"], help="Summarize visited pages with an LLM, or extract their passages most relevant to the step (rerank: BM25 then sentence embeddings).")
+    parser.add_argument("--planning_batch_size", type=int, default=1, help="Number of search tree nodes expanded concurrently during planning.")
 
     args = parser.parse_args()
 
@@ -62,11 +66,11 @@ if __name__ == "__main__":
             file_path = None
 
             # run the meta planning
-            runner = MetaPlanningRunner(question=question, file_path=file_path, model=args.planner_model, openai_client=openai_client)
+            runner = MetaPlanningRunner(question=question, file_path=file_path, model=args.planner_model, openai_client=openai_client, batch_size=args.planning_batch_size)
             search_tree = runner.run()
             top_plans = search_tree.select_top_plans()
             result['top_plans'] = [plan.model_dump() for plan in top_plans]
-            plan_graph = PlanGraph()
+            plan_graph = PlanGraph(similarity_threshold=args.merge_threshold)
             plan_graph.add_plan_list(top_plans)
             result['mermaid_graph'] = plan_graph.get_mermaid()
 
@@ -93,18 +97,20 @@ if __name__ == "__main__":
                     qwen_client=qwen_client,
                     finished_steps=finished_steps,
                     file_path=file_path,
-                    model=args.executor_model
+                    model=args.executor_model,
+                    concurrent_tools=args.concurrent_tools,
+                    visit_mode=args.visit_mode
                 )
                 step_result = step_executor.run()
                 # todo: verify step results by meta agent
                 result['step_by_step_results'].append(step_result)
 
-                 # Add execution experience into memory
-                memory.add(question=result['question'], 
-                           step=next_step.goal, 
-                           actions=step_result['actions'], 
-                           result=step_result['result'], 
-                           reference=step_result['reference'])
+                 # Queue execution experience for annotation into memory, off the critical path
+                memory.add_async(question=result['question'], 
+                                 step=next_step.goal, 
+                                 actions=step_result['actions'], 
+                                 result=step_result['result'], 
+                                 reference=step_result['reference'])
 
                 # update graph
                 step_node = meta_agent.plan_graph.exist_step(step=next_step)
@@ -127,6 +133,7 @@ if __name__ == "__main__":
     with open(f"GAIA_level{args.level}_{args.split}_results_openai.json", "w", encoding="utf-8") as f:
         json.dump(result_json, f, indent=4)
 
-    # save current memory
+    # save current memory once all queued annotations are committed
+    memory.flush()
     memory.serialize()
 
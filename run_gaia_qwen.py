@@ -7,8 +7,11 @@ from transformers import pipeline, TextStreamer
 
 from tree_search.qwen.meta_tree_search_runner import MetaPlanner
 from plan_merger.base import PlanGraph
+from plan_merger.scheduler import execute_steps_in_parallel
 from agents.qwen.meta_agent import MetaAgent
 from web_explorer.qwen.step_executor import StepExecutor
+from llm.generation_service import GenerationService
+from llm.backends import create_backend
 
 from datasets import load_dataset
 
@@ -16,13 +19,14 @@ import json
 
 import traceback
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Any
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def process_tasks_with_error_handling(test_set: List[Dict], meta_generator, executor_generator, meta_streamer, executor_streamer, qwen_client, max_retries: int = 2):
+def process_tasks_with_error_handling(test_set: List[Dict], meta_generator, executor_generator, meta_streamer, executor_streamer, qwen_client, max_retries: int = 2, num_workers: int = 1, concurrent_tools: bool = False, parallel_branches: int = 1, merge_threshold: float = None, visit_mode: str = "summarize", reuse_prefix: bool = False):
     """
     Process tasks with comprehensive error handling.
     
@@ -31,42 +35,55 @@ def process_tasks_with_error_handling(test_set: List[Dict], meta_generator, exec
         generator: The model generator
         qwen_client: Qwen client for summarization
         max_retries: Number of retries per task before giving up
+        num_workers: Number of tasks processed concurrently, their generation requests
+            are batched when the generators are GenerationService instances
+        concurrent_tools: Let step executors run several search/visit actions per turn concurrently
+        parallel_branches: Maximum number of independent plan graph steps executed in parallel per task
+        merge_threshold: Similarity threshold to also merge near-identical steps of different plans
+        visit_mode: "summarize" visited pages with the summarizer model, or "extract"/"rerank" their most relevant passages
+        reuse_prefix: Keep the KV cache of a step conversation between turns (in-process transformers generator only)
     
     Returns:
         List of results including successful and failed task outcomes
     """
-    result_json = []
+    result_json = [None] * len(test_set)
     successful_tasks = 0
     failed_tasks = 0
     
-    for i, task in enumerate(test_set):
-        task_id = task.get('task_id', f'task_{i}')
-        logger.info(f"Starting task {i+1}/{len(test_set)}: {task_id}")
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {}
+        for i, task in enumerate(test_set):
+            task_id = task.get('task_id', f'task_{i}')
+            logger.info(f"Starting task {i+1}/{len(test_set)}: {task_id}")
+            
+            # Skip tasks without file_path (if that's your condition)
+            if task.get('file_path', "") == "":
+                future = executor.submit(process_single_task, task, meta_generator, executor_generator, meta_streamer, executor_streamer, qwen_client, i+1, len(test_set), max_retries, concurrent_tools, parallel_branches, merge_threshold, visit_mode, reuse_prefix)
+                futures[future] = i
+            else:
+                logger.info(f"Skipping task {task_id} - has file_path")
+                result = {
+                    "task_id": task_id,
+                    "question": task.get('Question', ''),
+                    "status": "skipped",
+                    "error": "Task has file_path - skipped per condition",
+                    "step_by_step_results": []
+                }
+                result_json[i] = result
         
-        # Skip tasks without file_path (if that's your condition)
-        if task.get('file_path', "") == "":
-            result = process_single_task(task, meta_generator, executor_generator, meta_streamer, executor_streamer, qwen_client, i+1, len(test_set), max_retries)
-            result_json.append(result)
+        for future in as_completed(futures):
+            result = future.result()
+            result_json[futures[future]] = result
             
             if result.get('status') == 'success':
                 successful_tasks += 1
             else:
                 failed_tasks += 1
-        else:
-            logger.info(f"Skipping task {task_id} - has file_path")
-            result = {
-                "task_id": task_id,
-                "question": task.get('Question', ''),
-                "status": "skipped",
-                "error": "Task has file_path - skipped per condition",
-                "step_by_step_results": []
-            }
-            result_json.append(result)
     
     logger.info(f"Task processing completed. Successful: {successful_tasks}, Failed: {failed_tasks}, Total: {len(test_set)}")
     return result_json
 
-def process_single_task(task: Dict, meta_generator, executor_generator, meta_streamer, executor_streamer, qwen_client, task_num: int, total_tasks: int, max_retries: int = 2) -> Dict[str, Any]:
+def process_single_task(task: Dict, meta_generator, executor_generator, meta_streamer, executor_streamer, qwen_client, task_num: int, total_tasks: int, max_retries: int = 2, concurrent_tools: bool = False, parallel_branches: int = 1, merge_threshold: float = None, visit_mode: str = "summarize", reuse_prefix: bool = False) -> Dict[str, Any]:
     """
     Process a single task with error handling and retries.
     
@@ -113,7 +130,7 @@ def process_single_task(task: Dict, meta_generator, executor_generator, meta_str
             
             # Step 3: Initialize plan graph and meta agent
             try:
-                plan_graph = PlanGraph()
+                plan_graph = PlanGraph(similarity_threshold=merge_threshold)
                 plan_graph.add_plan_list(top_plans)
                 result['mermaid_graph'] = plan_graph.get_mermaid()
                 meta_agent = MetaAgent(plan_graph=plan_graph, question=question, generator=meta_generator, streamer=meta_streamer)
@@ -128,16 +145,43 @@ def process_single_task(task: Dict, meta_generator, executor_generator, meta_str
                 try:
                     execution_steps += 1
                     
-                    # Generate next step
+                    # Generate next step(s)
                     try:
-                        next_step = meta_agent.generate_next_step()
-                        # Meta agent chooses to skip
-                        if not next_step:
+                        next_steps = meta_agent.generate_next_steps(max_steps=parallel_branches)
+                        # Meta agent chooses to skip, go on with the following steps
+                        if not next_steps:
+                            if not meta_agent.plan_graph.get_next_exec_steps():
+                                logger.error(f"No executable steps left in the plan graph for task {task_id}")
+                                break
                             continue
+                        next_step = next_steps[0]
                     except Exception as e:
                         logger.error(f"Error generating next step for task {task_id}: {str(e)}")
                         # Try to finalize with current progress
                         break
+
+                    # Execute independent branches in parallel, the meta agent decides on the join afterwards
+                    if len(next_steps) > 1:
+                        logger.info(f"Task {task_id} - executing {len(next_steps)} independent steps in parallel: {[step.goal for step in next_steps]}")
+
+                        def run_step(step, finished_steps):
+                            step_executor = StepExecutor(
+                                question=question,
+                                generator=executor_generator,
+                                streamer=executor_streamer,
+                                current_step=step,
+                                finished_steps=finished_steps,
+                                file_path=file_path,
+                                qwen_client=qwen_client,
+                                concurrent_tools=concurrent_tools,
+                                visit_mode=visit_mode,
+                                reuse_prefix=reuse_prefix
+                            )
+                            return step_executor.run()
+
+                        step_results = execute_steps_in_parallel(meta_agent.plan_graph, next_steps, run_step, max_workers=parallel_branches)
+                        result['step_by_step_results'].extend(step_results)
+                        continue
                     
                     # Check if execution should end
                     if next_step.goal == "END":
@@ -162,7 +206,10 @@ def process_single_task(task: Dict, meta_generator, executor_generator, meta_str
                             current_step=next_step,
                             finished_steps=finished_steps,
                             file_path=file_path,
-                            qwen_client=qwen_client
+                            qwen_client=qwen_client,
+                            concurrent_tools=concurrent_tools,
+                            visit_mode=visit_mode,
+                            reuse_prefix=reuse_prefix
                         )
                         
                         step_result = step_executor.run()
@@ -247,33 +294,76 @@ if __name__ == "__main__":
     parser.add_argument("--split", type=str, default="validation", help="The split of the GAIA benchmark.")
     parser.add_argument("--meta_model_name_or_path", type=str, default="Qwen/Qwen2.5-32B", help="Meta model ID or path.")
     parser.add_argument("--executor_model_name_or_path", type=str, default="Qwen/Qwen2.5-32B", help="Executor model ID or path.")
+    parser.add_argument("--num_workers", type=int, default=1, help="Number of tasks processed concurrently.")
+    parser.add_argument("--generation_batch_size", type=int, default=1, help="Maximum number of generation requests batched on the GPU (1 disables batching).")
+    parser.add_argument("--merge_threshold", type=float, default=None, help="Also merge near-identical steps of different plans whose similarity reaches this threshold (0-1).")
+    parser.add_argument("--parallel_branches", type=int, default=1, help="Maximum number of independent plan steps executed in parallel (1 executes steps one by one).")
+    parser.add_argument("--concurrent_tools", action="store_true", help="Let the step executor run several search/visit actions per turn concurrently.")
+    parser.add_argument("--visit_mode", type=str, default="summarize", choices=["summarize", "extract", "rerank"], help="Summarize visited pages with an LLM, or extract their passages most relevant to the step (rerank: BM25 then sentence embeddings).")
+    parser.add_argument("--reuse_prefix", action="store_true", help="Keep the KV cache of a step conversation between turns, so each turn only prefills its new tokens (transformers backend without batching).")
+    parser.add_argument("--stream", action="store_true", help="Stream generations to stdout when batching is enabled.")
+    parser.add_argument("--backend", type=str, default="transformers", choices=["transformers", "openai", "stub"], help="LLM backend: in-process transformers, an OpenAI-compatible server, or an offline stub.")
+    parser.add_argument("--backend_base_url", type=str, default=None, help="Base URL of the OpenAI-compatible server, e.g. http://localhost:8000/v1 for vLLM.")
+    parser.add_argument("--backend_api_key", type=str, default=os.getenv("BACKEND_API_KEY"), help="API key of the OpenAI-compatible server.")
 
     args = parser.parse_args()
 
-    meta_generator = pipeline(
-        "text-generation", 
-        args.meta_model_name_or_path, 
-        torch_dtype="auto", 
-        device_map="auto",
-        trust_remote_code=True
-    )
+    if args.reuse_prefix and (args.backend != "transformers" or args.generation_batch_size > 1 or args.num_workers > 1 or args.parallel_branches > 1):
+        # The KV cache of a session belongs to one in-process pipeline used by one thread at a time
+        parser.error("--reuse_prefix requires --backend transformers without --generation_batch_size, --num_workers or --parallel_branches above 1")
+
+    if args.backend == "transformers":
+        meta_generator = pipeline(
+            "text-generation", 
+            args.meta_model_name_or_path, 
+            torch_dtype="auto", 
+            device_map="auto",
+            trust_remote_code=True
+        )
+
+        if args.executor_model_name_or_path == args.meta_model_name_or_path:
+            # Share the loaded model between the meta agent and the executor
+            executor_generator = meta_generator
+        else:
+            executor_generator = pipeline(
+                "text-generation", 
+                args.executor_model_name_or_path, 
+                torch_dtype="auto", 
+                device_map="auto",
+                trust_remote_code=True
+            )
 
-    executor_generator = pipeline(
-        "text-generation", 
-        args.executor_model_name_or_path, 
-        torch_dtype="auto", 
-        device_map="auto",
-        trust_remote_code=True
-    )
+        meta_streamer = TextStreamer(meta_generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
 
-    meta_streamer = TextStreamer(meta_generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        executor_streamer = TextStreamer(executor_generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
 
-    executor_streamer = TextStreamer(executor_generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        if args.generation_batch_size > 1 or args.num_workers > 1 or args.parallel_branches > 1:
+            # Route all generation requests through shared batching services, so concurrent tasks and
+            # branches never call a pipeline (or share a streamer) from several threads
+            meta_service = GenerationService(meta_generator, max_batch_size=args.generation_batch_size, stream=args.stream)
+            if executor_generator is meta_generator:
+                executor_service = meta_service
+            else:
+                executor_service = GenerationService(executor_generator, max_batch_size=args.generation_batch_size, stream=args.stream)
+            meta_generator, executor_generator = meta_service, executor_service
+    else:
+        # Remote or stub backends are callable like a pipeline, the server does the batching
+        meta_generator = create_backend(args.backend, model=args.meta_model_name_or_path, base_url=args.backend_base_url, api_key=args.backend_api_key)
+        if args.executor_model_name_or_path == args.meta_model_name_or_path:
+            executor_generator = meta_generator
+        else:
+            executor_generator = create_backend(args.backend, model=args.executor_model_name_or_path, base_url=args.backend_base_url, api_key=args.backend_api_key)
+        meta_streamer = None
+        executor_streamer = None
 
-    qwen_client = OpenAI(
-                    base_url="https://openrouter.ai/api/v1",
-                    api_key=os.getenv("OPENROUTER_API_KEY"),
-                )
+    if args.backend == "stub":
+        # Keep dry runs offline, the summarizer goes through the stub as well
+        qwen_client = create_backend("stub")
+    else:
+        qwen_client = OpenAI(
+                        base_url="https://openrouter.ai/api/v1",
+                        api_key=os.getenv("OPENROUTER_API_KEY"),
+                    )
 
     # load the GAIA benchmark
     test_set = load_dataset("./dataset/GAIA/GAIA.py", name=f"2023_level{args.level}", data_dir=".", split=args.split, trust_remote_code=True)
@@ -284,7 +374,13 @@ if __name__ == "__main__":
                                                     executor_generator=executor_generator,
                                                     meta_streamer=meta_streamer,
                                                     executor_streamer=executor_streamer,
-                                                    qwen_client=qwen_client)
+                                                    qwen_client=qwen_client,
+                                                    num_workers=args.num_workers,
+                                                    concurrent_tools=args.concurrent_tools,
+                                                    parallel_branches=args.parallel_branches,
+                                                    merge_threshold=args.merge_threshold,
+                                                    visit_mode=args.visit_mode,
+                                                    reuse_prefix=args.reuse_prefix)
 
     with open(f"GAIA_level{args.level}_{args.split}_qwen_results.json", "w", encoding="utf-8") as f:
         json.dump(result_json, f, indent=4)
@@ -11,8 +11,10 @@ from transformers import pipeline
 
 from tree_search.qwen.meta_tree_search_runner import MetaPlanner
 from plan_merger.base import PlanGraph
+from plan_merger.scheduler import execute_steps_in_parallel
 from agents.qwen.meta_agent import MetaAgent
 from web_explorer.qwen.step_executor import StepExecutor
+from llm.generation_service import GenerationService
 
 
 def get_available_devices():
@@ -23,7 +25,7 @@ def get_available_devices():
         return ["cpu"]
 
 
-def initialize_worker(model_name_or_path: str, device: str):
+def initialize_worker(model_name_or_path: str, device: str, parallel_branches: int = 1, generation_batch_size: int = 1):
     """Initialize worker process with model loaded on specific device."""
     global generator, qwen_client
     
@@ -40,6 +42,10 @@ def initialize_worker(model_name_or_path: str, device: str):
         device_map=device_map,
         trust_remote_code=True
     )
+
+    if parallel_branches > 1 or generation_batch_size > 1:
+        # Parallel branches generate from several threads, the service owns the pipeline and batches them
+        generator = GenerationService(generator, max_batch_size=max(parallel_branches, generation_batch_size))
     
     qwen_client = OpenAI(
         base_url="https://openrouter.ai/api/v1",
@@ -71,6 +77,7 @@ def process_single_task(task_data: Dict[str, Any]) -> Dict[str, Any]:
         # Initialize planner
         plan_runner = MetaPlanner(
             generator=generator,
+            streamer=None,
             question=question,
             file_path=file_path
         )
@@ -87,12 +94,42 @@ def process_single_task(task_data: Dict[str, Any]) -> Dict[str, Any]:
         meta_agent = MetaAgent(
             plan_graph=plan_graph,
             question=question,
-            generator=generator
+            generator=generator,
+            streamer=None
         )
 
         # Execute steps
-        while True:
-            next_step = meta_agent.generate_next_step()
+        parallel_branches = task_data.get('parallel_branches', 1)
+        max_execution_steps = 50  # Prevent infinite loops
+        for _ in range(max_execution_steps):
+            next_steps = meta_agent.generate_next_steps(max_steps=parallel_branches)
+            if not next_steps:
+                # The meta agent skipped the current candidates, go on with the following steps
+                if not meta_agent.plan_graph.get_next_exec_steps():
+                    raise RuntimeError("No executable steps left in the plan graph")
+                continue
+
+            # Execute independent branches in parallel, the meta agent decides on the join afterwards
+            if len(next_steps) > 1:
+                print(f"Worker {os.getpid()}: Next steps for {task['task_id']}: {[step.goal for step in next_steps]}")
+
+                def run_step(step, finished_steps):
+                    step_executor = StepExecutor(
+                        generator=generator,
+                        streamer=None,
+                        current_step=step,
+                        question=question,
+                        finished_steps=finished_steps,
+                        file_path=file_path,
+                        qwen_client=qwen_client
+                    )
+                    return step_executor.run()
+
+                step_results = execute_steps_in_parallel(meta_agent.plan_graph, next_steps, run_step, max_workers=parallel_branches)
+                result['step_by_step_results'].extend(step_results)
+                continue
+
+            next_step = next_steps[0]
             if next_step.goal == "END":
                 # Finalize answer
                 final_answer = meta_agent.finalize_answer()
@@ -105,6 +142,7 @@ def process_single_task(task_data: Dict[str, Any]) -> Dict[str, Any]:
             
             step_executor = StepExecutor(
                 generator=generator,
+                streamer=None,
                 current_step=next_step,
                 question=question,
                 finished_steps=finished_steps,
@@ -124,6 +162,8 @@ def process_single_task(task_data: Dict[str, Any]) -> Dict[str, Any]:
             # Update graph
             step_node = meta_agent.plan_graph.exist_step(step=next_step)
             step_node.execution_result = step_result['result']
+        else:
+            raise RuntimeError(f"No final answer after {max_execution_steps} execution steps")
 
         result['status'] = 'completed'
         
@@ -168,7 +208,8 @@ def run_parallel_gaia(args):
         tasks_data.append({
             'task': task,
             'index': i,
-            'total': min(len(test_set), args.max_tasks) if args.max_tasks > 0 else len(test_set)
+            'total': min(len(test_set), args.max_tasks) if args.max_tasks > 0 else len(test_set),
+            'parallel_branches': args.parallel_branches
         })
     
     print(f"Processing {len(tasks_data)} tasks")
@@ -192,7 +233,7 @@ def run_parallel_gaia(args):
         for worker_id, (chunk, device) in enumerate(zip(task_chunks, device_assignments)):
             if chunk:  # Only submit if chunk is not empty
                 # Reinitialize worker with specific device
-                future = executor.submit(process_worker_chunk, chunk, args.model_name_or_path, device)
+                future = executor.submit(process_worker_chunk, chunk, args.model_name_or_path, device, args.parallel_branches, args.generation_batch_size)
                 future_to_task[future] = worker_id
         
         # Collect results
@@ -221,10 +262,10 @@ def run_parallel_gaia(args):
     print(f"Summary: {completed} completed, {failed} failed out of {len(results)} total tasks")
 
 
-def process_worker_chunk(chunk: List[Dict], model_name_or_path: str, device: str) -> List[Dict]:
+def process_worker_chunk(chunk: List[Dict], model_name_or_path: str, device: str, parallel_branches: int = 1, generation_batch_size: int = 1) -> List[Dict]:
     """Process a chunk of tasks in a single worker with specific device."""
     # Initialize worker with specific device
-    initialize_worker(model_name_or_path, device)
+    initialize_worker(model_name_or_path, device, parallel_branches, generation_batch_size)
     
     results = []
     for task_data in chunk:
@@ -242,7 +283,9 @@ if __name__ == "__main__":
     parser.add_argument("--model_name_or_path", type=str, default="Qwen/Qwen2.5-32B", help="Model ID or path.")
     parser.add_argument("--num_workers", type=int, default=-1, help="Number of parallel workers (-1 for auto-detect based on GPUs).")
     parser.add_argument("--max_tasks", type=int, default=-1, help="Maximum number of tasks to process (-1 for all tasks).")
+    parser.add_argument("--parallel_branches", type=int, default=1, help="Maximum number of independent plan steps executed in parallel per task.")
     parser.add_argument("--batch_size", type=int, default=1, help="Number of tasks per worker batch.")
+    parser.add_argument("--generation_batch_size", type=int, default=1, help="Maximum number of generation requests batched on each worker's GPU (1 disables batching).")
     
     args = parser.parse_args()
     
@@ -9,6 +9,7 @@ from tree_search.qwen.meta_tree_search_runner import MetaPlanner
 from plan_merger.base import PlanGraph
 from agents.qwen.meta_agent import MetaAgent
 from web_explorer.qwen.step_executor import StepExecutor
+from llm.generation_service import GenerationService
 
 from datasets import load_dataset
 
@@ -16,13 +17,14 @@ import json
 
 import traceback
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Any
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def process_tasks_with_error_handling(test_set: List[Dict], meta_generator, executor_generator, meta_streamer, executor_streamer, qwen_client, max_retries: int = 2):
+def process_tasks_with_error_handling(test_set: List[Dict], meta_generator, executor_generator, meta_streamer, executor_streamer, qwen_client, max_retries: int = 2, num_workers: int = 1):
     """
     Process tasks with comprehensive error handling.
     
@@ -31,25 +33,33 @@ def process_tasks_with_error_handling(test_set: List[Dict], meta_generator, exec
         generator: The model generator
         qwen_client: Qwen client for summarization
         max_retries: Number of retries per task before giving up
+        num_workers: Number of tasks processed concurrently, their generation requests
+            are batched when the generators are GenerationService instances
     
     Returns:
         List of results including successful and failed task outcomes
     """
-    result_json = []
+    result_json = [None] * len(test_set)
     successful_tasks = 0
     failed_tasks = 0
     
-    for i, task in enumerate(test_set):
-        task_id = task.get('Record ID', f'task_{i}')
-        logger.info(f"Starting task {i+1}/{len(test_set)}: {task_id}")
-        
-        result = process_single_task(task, meta_generator, executor_generator, meta_streamer, executor_streamer, qwen_client, i+1, len(test_set), max_retries)
-        result_json.append(result)
-        
-        if result.get('status') == 'success':
-            successful_tasks += 1
-        else:
-            failed_tasks += 1
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {}
+        for i, task in enumerate(test_set):
+            task_id = task.get('Record ID', f'task_{i}')
+            logger.info(f"Starting task {i+1}/{len(test_set)}: {task_id}")
+
+            future = executor.submit(process_single_task, task, meta_generator, executor_generator, meta_streamer, executor_streamer, qwen_client, i+1, len(test_set), max_retries)
+            futures[future] = i
+
+        for future in as_completed(futures):
+            result = future.result()
+            result_json[futures[future]] = result
+
+            if result.get('status') == 'success':
+                successful_tasks += 1
+            else:
+                failed_tasks += 1
         # else:
         #     logger.info(f"Skipping task {task_id} - has file_path")
         #     result = {
@@ -247,6 +257,9 @@ if __name__ == "__main__":
     # parser.add_argument("--split", type=str, default="validation", help="The split of the GAIA benchmark.")
     parser.add_argument("--meta_model_name_or_path", type=str, default="Qwen/Qwen2.5-32B", help="Meta model ID or path.")
     parser.add_argument("--executor_model_name_or_path", type=str, default="Qwen/Qwen2.5-32B", help="Executor model ID or path.")
+    parser.add_argument("--num_workers", type=int, default=1, help="Number of tasks processed concurrently.")
+    parser.add_argument("--generation_batch_size", type=int, default=1, help="Maximum number of generation requests batched on the GPU (1 disables batching).")
+    parser.add_argument("--stream", action="store_true", help="Stream generations to stdout when batching is enabled.")
 
     args = parser.parse_args()
 
@@ -258,18 +271,32 @@ if __name__ == "__main__":
         trust_remote_code=True
     )
 
-    executor_generator = pipeline(
-        "text-generation", 
-        args.executor_model_name_or_path, 
-        torch_dtype="auto", 
-        device_map="auto",
-        trust_remote_code=True
-    )
+    if args.executor_model_name_or_path == args.meta_model_name_or_path:
+        # Share the loaded model between the meta agent and the executor
+        executor_generator = meta_generator
+    else:
+        executor_generator = pipeline(
+            "text-generation", 
+            args.executor_model_name_or_path, 
+            torch_dtype="auto", 
+            device_map="auto",
+            trust_remote_code=True
+        )
 
     meta_streamer = TextStreamer(meta_generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
 
     executor_streamer = TextStreamer(executor_generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
 
+    if args.generation_batch_size > 1 or args.num_workers > 1:
+        # Route all generation requests through shared batching services, so concurrent tasks
+        # never call a pipeline (or share a streamer) from several threads
+        meta_service = GenerationService(meta_generator, max_batch_size=args.generation_batch_size, stream=args.stream)
+        if executor_generator is meta_generator:
+            executor_service = meta_service
+        else:
+            executor_service = GenerationService(executor_generator, max_batch_size=args.generation_batch_size, stream=args.stream)
+        meta_generator, executor_generator = meta_service, executor_service
+
     qwen_client = OpenAI(
                     base_url="https://openrouter.ai/api/v1",
                     api_key=os.getenv("OPENROUTER_API_KEY"),
@@ -283,7 +310,8 @@ if __name__ == "__main__":
                                                     executor_generator=executor_generator,
                                                     meta_streamer=meta_streamer,
                                                     executor_streamer=executor_streamer,
-                                                    qwen_client=qwen_client)
+                                                    qwen_client=qwen_client,
+                                                    num_workers=args.num_workers)
 
     with open(f"GPQA_qwen_results.json", "w", encoding="utf-8") as f:
         json.dump(result_json, f, indent=4)
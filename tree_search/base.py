@@ -1,6 +1,6 @@
 import math
 
-from tree_search.schemas import Plan, Step, PlanScore, ModificationResponse, ActionType, ActionParams
+from tree_search.schemas import Plan, Step, PlanScore, ActionType, ActionParams, apply_modification
 # from schemas import Plan, Step, PlanScore, ModificationResponse, ActionType, ActionParams
 
 EXPLORATION_CONSTANT = 1.41  # Commonly used exploration constant in UCT
@@ -12,35 +12,77 @@ class BaseTreeNode:
         self.children = children if children is not None else []
         self.execution_flag = execution_flag
         self.execution_result = execution_result
+        # Number of in-flight expansions of this node, used as virtual loss during batched selection
+        self.pending_expansions = 0
+        # Cached tuple of this node's plan steps, derived from the parent's cached steps on first use.
+        # Step objects are shared between nodes, so they must be treated as immutable.
+        self._steps = None
 
-    def get_plan(self):
-        modifications = []
+    def _derive_steps(self, parent_steps: tuple) -> tuple:
+        raise NotImplementedError("This method should be implemented by subclasses.")
+
+    def get_steps(self) -> tuple:
+        """
+        Return the steps of this node's plan, materializing it from the closest cached ancestor.
+        Each node applies only its own modification on top of its parent's steps, so the
+        modification chain is never replayed from the root.
+        """
+        if self._steps is not None:
+            return self._steps
+
+        # Walk up to the closest node whose steps are already materialized
+        pending = []
         current_node = self
-        while current_node.parent:
-            modifications.append(ModificationResponse(
-                rationale=current_node.rationale,
-                action=ActionType(current_node.action),
-                # action_params=ActionParams(**current_node.action_params)
-                action_params=current_node.action_params
-            ))
+        while current_node._steps is None and current_node.parent:
+            pending.append(current_node)
             current_node = current_node.parent
-        modifications.reverse()
-        return current_node.root_plan.apply_modifications(modifications)
+        if current_node._steps is None:
+            current_node._steps = current_node._derive_steps(None)
+
+        # Materialize the path back down
+        parent_steps = current_node._steps
+        for node in reversed(pending):
+            node._steps = node._derive_steps(parent_steps)
+            parent_steps = node._steps
+        return self._steps
+
+    def invalidate_plan(self):
+        """
+        Drop the cached steps of this node and its whole subtree.
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._steps is None and node is not self:
+                # Descendants of an unmaterialized node were never materialized either
+                continue
+            node._steps = None
+            stack.extend(node.children)
+
+    def get_plan(self):
+        return Plan(steps=list(self.get_steps()))
 
     # def add_child(self, rationale: str, action: str, action_params: dict, score: PlanScore):
     #     child_node = ModifiedNode(rationale, action, action_params, score)
     #     self.children.append(child_node)
 
+    def num_visits(self) -> int:
+        """
+        Number of expansions of this node, counting in-flight ones as virtual loss.
+        """
+        return len(self.children) + self.pending_expansions
+
     def compute_uct(self):
         # prioritize unexpanded nodes
-        if not self.children:
+        visits = self.num_visits()
+        if not visits:
             return float('inf')
         
-        parent_visits = len(self.parent.children) if self.parent else 1
+        parent_visits = self.parent.num_visits() if self.parent else 1
         score = self.score.effectiveness + self.score.completeness + self.score.executability
-        exploitation = score / len(self.children)
+        exploitation = score / visits
         exploration = EXPLORATION_CONSTANT * math.sqrt(
-            math.log(parent_visits) / len(self.children)
+            math.log(parent_visits) / visits
         )
         return exploitation + exploration      
 
@@ -50,6 +92,19 @@ class InitialNode(BaseTreeNode):
         self.question = question
         self.root_plan = plan
 
+    @property
+    def root_plan(self) -> Plan:
+        return self._root_plan
+
+    @root_plan.setter
+    def root_plan(self, plan: Plan):
+        self._root_plan = plan
+        self.invalidate_plan()
+
+    def _derive_steps(self, parent_steps: tuple) -> tuple:
+        # Copy once so later edits of the root plan cannot leak into cached plans
+        return tuple(self._root_plan.model_copy(deep=True).steps)
+
 class ModifiedNode(BaseTreeNode):
     def __init__(self, parent: BaseTreeNode, rationale: str, action: str, action_params: dict, score: PlanScore = None, children=None, execution_flag=False, execution_result=None):
         super().__init__(score=score, parent=parent, children=children, execution_flag=execution_flag, execution_result=execution_result)
@@ -57,6 +112,31 @@ class ModifiedNode(BaseTreeNode):
         self.action = action
         self.action_params = action_params
 
+    @property
+    def action(self):
+        return self._action
+
+    @action.setter
+    def action(self, action):
+        self._action = action
+        self.invalidate_plan()
+
+    @property
+    def action_params(self):
+        return self._action_params
+
+    @action_params.setter
+    def action_params(self, action_params):
+        self._action_params = action_params
+        self.invalidate_plan()
+
+    def _derive_steps(self, parent_steps: tuple) -> tuple:
+        action_params = self._action_params
+        if isinstance(action_params, dict):
+            action_params = ActionParams(**action_params)
+        # Only the step references are copied, the steps themselves are shared with the parent
+        return tuple(apply_modification(list(parent_steps), ActionType(self._action), action_params))
+
 # class SearchTree:
 #     def __init__(self, question: str, steps: list[Step], max_depth: int = 3, max_children: int = 3):
 #         self.question = question
@@ -97,8 +177,8 @@ class SearchTree:
             if depth >= self.max_depth:
                 return  # Reached max depth, don't go further
 
-            # Check if this node is expandable (not full)
-            if len(node.children) < self.max_children:
+            # Check if this node is expandable (not full), counting in-flight expansions
+            if node.num_visits() < self.max_children:
                 uct = node.compute_uct()
                 if uct > best_uct:
                     best_uct = uct
@@ -110,6 +190,31 @@ class SearchTree:
 
         traverse(self.root, depth=0)
         return best_node
+
+    def select_batch(self, batch_size: int = 1):
+        """
+        Select up to batch_size nodes for concurrent expansion.
+        Every selected node gets a pending expansion (virtual loss) so that the following
+        selections spread over the frontier instead of picking the same node again.
+        The caller must hand each selected node back through complete_expansion.
+        """
+        selected_nodes = []
+        for _ in range(batch_size):
+            node = self.select()
+            if node is None:
+                break
+            node.pending_expansions += 1
+            selected_nodes.append(node)
+        return selected_nodes
+
+    def complete_expansion(self, node: BaseTreeNode, child: BaseTreeNode = None):
+        """
+        Release the pending expansion of a node selected by select_batch and attach the expanded child.
+        Passing child=None drops a failed expansion so the node can be selected again.
+        """
+        node.pending_expansions -= 1
+        if child is not None:
+            node.children.append(child)
     
     def print_tree(self):
         """
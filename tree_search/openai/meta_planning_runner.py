@@ -3,6 +3,7 @@ import os
 import argparse
 from dotenv import load_dotenv
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 
 from tree_search.base import InitialNode, ModifiedNode, BaseTreeNode, SearchTree
@@ -17,11 +18,36 @@ from tree_search.openai.openai_utils import (
 
 
 class MetaPlanningRunner:
-    def __init__(self, question: str, openai_client: OpenAI, file_path: str = None, model: str = "gpt-4"):
+    def __init__(self, question: str, openai_client: OpenAI, file_path: str = None, model: str = "gpt-4", batch_size: int = 1):
         self.question = question
         self.file_path = file_path
         self.model = model
         self.openai_client = openai_client
+        # Number of frontier nodes expanded and evaluated concurrently per iteration
+        self.batch_size = batch_size
+
+    def expand_node(self, selected_node: BaseTreeNode) -> ModifiedNode:
+        """
+        Expand a selected node with one modification and evaluate the modified plan.
+        The returned node is not attached to the tree yet.
+        """
+        # Expand the selected node
+        modifications = modify_plan(self.openai_client, self.question, selected_node.get_plan(), self.file_path, self.model)
+
+        print(f"Modifications for node\n {selected_node.get_plan()}:\n {modifications}")
+
+        # Create the modified node, it is appended to the search tree by the caller
+        expanded_node = ModifiedNode(
+            parent=selected_node,
+            rationale=modifications.rationale,
+            action=modifications.action,
+            action_params=modifications.action_params
+        )
+
+        # Evaluate the modified plan
+        plan = expanded_node.get_plan()
+        expanded_node.score = evaluate_plan(self.openai_client, self.question, plan, self.file_path, self.model)
+        return expanded_node
     
     def run(self):
         # First create an initial plan
@@ -37,30 +63,27 @@ class MetaPlanningRunner:
 
         print("Start expanding the search tree...")
 
-        selected_node = search_tree.select()
-        while selected_node:
-            # Expand the selected node
-            modifications = modify_plan(self.openai_client, self.question, selected_node.get_plan(), self.file_path, self.model)
+        with ThreadPoolExecutor(max_workers=self.batch_size) as executor:
+            selected_nodes = search_tree.select_batch(self.batch_size)
+            while selected_nodes:
+                # Materialize the parent plans before handing the nodes to the workers
+                for selected_node in selected_nodes:
+                    selected_node.get_steps()
 
-            print(f"Modifications for node\n {selected_node.get_plan()}:\n {modifications}")
+                # Expand and evaluate all selected nodes concurrently
+                futures = [executor.submit(self.expand_node, selected_node) for selected_node in selected_nodes]
 
-            # Create modified nodes and append them to the search tree
-            expanded_node = ModifiedNode(
-                parent=selected_node,
-                rationale=modifications.rationale,
-                action=modifications.action,
-                action_params=modifications.action_params
-            )
+                # Merge the results back into the tree
+                for selected_node, future in zip(selected_nodes, futures):
+                    try:
+                        expanded_node = future.result()
+                    except Exception:
+                        search_tree.complete_expansion(selected_node)
+                        raise
+                    search_tree.complete_expansion(selected_node, expanded_node)
 
-            selected_node.children.append(expanded_node)
-
-            # Evaluate the modified plan
-            plan = expanded_node.get_plan()
-            expanded_node.score = evaluate_plan(self.openai_client, self.question, plan, self.file_path, self.model)
-
-
-            # Select the next node for expansion
-            selected_node = search_tree.select()
+                # Select the next nodes for expansion
+                selected_nodes = search_tree.select_batch(self.batch_size)
 
         # # Print out the final search tree
         # search_tree.print_tree()
@@ -87,10 +110,11 @@ if __name__ == "__main__":
     arg_parser.add_argument("--question", type=str, required=True, help="The question to answer.")
     arg_parser.add_argument("--file_path", type=str, default=None, help="Path to the file to use for context.")
     arg_parser.add_argument("--model", type=str, default="gpt-4o-mini", help="The model to use for LLM operations.")
+    arg_parser.add_argument("--batch_size", type=int, default=1, help="Number of tree nodes expanded concurrently.")
     # arg_parser.add_argument("--save", action='store_true', help="Whether to save the search tree to a file.")
 
     args = arg_parser.parse_args()
 
     # Initialize the MetaPlanningRunner with the provided arguments
-    runner = MetaPlanningRunner(question=args.question, file_path=args.file_path, model=args.model)
+    runner = MetaPlanningRunner(question=args.question, file_path=args.file_path, model=args.model, batch_size=args.batch_size)
     runner.run()
\ No newline at end of file
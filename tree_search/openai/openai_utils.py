@@ -9,99 +9,17 @@ from tree_search.prompts import (
 )
 
 from tree_search.llm_utils import (
-    encode_image,
     extract_plan,
     extract_modification,
     extract_scores
 )
 
 from tree_search.schemas import Plan, ModificationResponse, PlanScore
+from document_tools.attachment_input import attachment_messages
 
-UTF8_EXTENSIONS = [".txt", ".md", ".csv", ".json", ".jsonl", "jsonld", ".xml", ".py"]
-IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png"]
 
 def generate_structured_response(openai_client: OpenAI, user_prompt: str, schema: BaseModel, system_prompt: str, extract_func: Callable[[str], Tuple[str, Optional[Any]]], file_path: str = None, model: str = "gpt-4o-mini"):
-    if not file_path:
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-        # response = openai_client.chat.completions.create(
-        #     model=model,
-        #     messages=[
-        #         {"role": "system", "content": system_prompt},
-        #         {"role": "user", "content": user_prompt}
-        #     ],
-        # )
-
-        # response_text = response.choices[0].message.content
-        # extracted_result = extract_func(response_text)
-    else:
-        if file_path.split(".")[-1] in IMAGE_EXTENSIONS:
-            encoded_image = encode_image(file_path)
-            messages = [
-                {
-                    "role": "system",
-                    "content": system_prompt,
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        { "type": "input_text", "text": user_prompt },
-                        {
-                            "type": "input_image",
-                            "image_url": f"data:image/{file_path.split('.')[-1]};base64,{encoded_image}",
-                        },
-                    ],
-                }
-            ]
-        elif file_path.split(".")[-1] in UTF8_EXTENSIONS:
-            with open(file_path, "r", encoding="utf-8") as f:
-                file_content = f.read()
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt + "\n\nFile content:\n" + file_content}
-            ]
-        elif file_path.split(".")[-1] == "pdf":
-            file = openai_client.files.create(
-                file=open(file_path, "rb"),
-                purpose="user_data"
-            )
-
-            messages = [
-                {
-                    "role": "system",
-                    "content": system_prompt,
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_file",
-                            "file_id": file.id,
-                        },
-                        {
-                            "type": "input_text",
-                            "text": user_prompt,
-                        },
-                    ]
-                }
-            ]
-        elif file_path.endswith(".zip"):
-            from document_tools.document_parser import DocumentParser
-            parser = DocumentParser()
-            extracted_files = parser._unzip_file(file_path)
-
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"{user_prompt}\n\nZip content:\n{extracted_files}"}
-            ]
-
-        else:
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt + f"\n\nFile path: {file_path}"}
-            ]
+    messages = attachment_messages(openai_client, user_prompt, file_path, system_prompt)
 
     while True:
 
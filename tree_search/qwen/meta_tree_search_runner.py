@@ -6,12 +6,13 @@ from tree_search.base import SearchTree, ModifiedNode
 
 from tree_search.qwen.qwen_utils import (
     generate_initial_plan,
-    modify_plan,
-    evaluate_plan
+    modify_plans,
+    evaluate_plan,
+    evaluate_plans
 )
 
 class MetaPlanner:
-    def __init__(self, generator: pipeline, streamer: TextStreamer, question: str, file_path: str = None):
+    def __init__(self, generator: pipeline, streamer: TextStreamer, question: str, file_path: str = None, batch_size: int = 1):
     # def __init__(self, model: AutoModelForCausalLM, tokenizer: AutoTokenizer, question: str, file_path: str = None):
         # self.model = model
         # self.tokenizer = tokenizer
@@ -19,6 +20,8 @@ class MetaPlanner:
         self.streamer = streamer
         self.question = question
         self.file_path = file_path
+        # Number of frontier nodes expanded per iteration, their prompts are batched on the GPU
+        self.batch_size = batch_size
 
     def run(self):
         # First create an initial plan
@@ -45,42 +48,46 @@ class MetaPlanner:
 
         print("Start expanding the search tree...")
 
-        selected_node = search_tree.select()
-        while selected_node:
-            # Expand the selected node
-            modifications = modify_plan(
+        selected_nodes = search_tree.select_batch(self.batch_size)
+        while selected_nodes:
+            # Expand the selected nodes
+            modifications = modify_plans(
                 generator=self.generator,
                 streamer=self.streamer,
-                plan=selected_node.get_plan(),
+                plans=[selected_node.get_plan() for selected_node in selected_nodes],
                 question=self.question,
                 file_path=self.file_path
             )
 
             # print(f"Modifications from model:\n {modifications}")
 
-            # Create modified nodes and append them to the search tree
-            expanded_node = ModifiedNode(
-                parent=selected_node,
-                rationale=modifications.rationale,
-                action=modifications.action,
-                action_params=modifications.action_params
-            )
-
-            selected_node.children.append(expanded_node)
-
-            # Evaluate the modified plan
-            plan = expanded_node.get_plan()
-            expanded_node.score = evaluate_plan(
+            # Create modified nodes
+            expanded_nodes = [
+                ModifiedNode(
+                    parent=selected_node,
+                    rationale=modification.rationale,
+                    action=modification.action,
+                    action_params=modification.action_params
+                )
+                for selected_node, modification in zip(selected_nodes, modifications)
+            ]
+
+            # Evaluate the modified plans
+            scores = evaluate_plans(
                 generator=self.generator,
                 streamer=self.streamer,
-                plan=plan,
+                plans=[expanded_node.get_plan() for expanded_node in expanded_nodes],
                 question=self.question,
                 file_path=self.file_path
             )
 
+            # Append the evaluated nodes to the search tree
+            for selected_node, expanded_node, score in zip(selected_nodes, expanded_nodes, scores):
+                expanded_node.score = score
+                search_tree.complete_expansion(selected_node, expanded_node)
 
-            # Select the next node for expansion
-            selected_node = search_tree.select()
+            # Select the next nodes for expansion
+            selected_nodes = search_tree.select_batch(self.batch_size)
 
         # # Print out the final search tree
         # search_tree.print_tree()
@@ -98,6 +105,7 @@ if __name__ == "__main__":
     arg_parser.add_argument("--question", type=str, required=True, help="The question to answer.")
     arg_parser.add_argument("--file_path", type=str, default=None, help="Path to the file to use for context.")
     arg_parser.add_argument("--model_path_or_name", type=str, default="Qwen/Qwen2.5-32B", help="The model to use for LLM operations.")
+    arg_parser.add_argument("--batch_size", type=int, default=1, help="Number of tree nodes expanded per batch.")
 
     args = arg_parser.parse_args()
 
@@ -118,7 +126,8 @@ if __name__ == "__main__":
         generator=generator,
         streamer=streamer,
         question=args.question,
-        file_path=args.file_path
+        file_path=args.file_path,
+        batch_size=args.batch_size
     )
 
     runner.run()
@@ -16,6 +16,7 @@ from tree_search.llm_utils import (
 )
 
 from tree_search.schemas import Plan, ModificationResponse, PlanScore
+from llm.backends import LLMBackend
 
 def generate_response(model: AutoModelForCausalLM, tokenizer: AutoTokenizer, messages: List):
     # Check if tokenizer has chat template
@@ -119,6 +120,59 @@ def generate_structured_response(generator: pipeline, streamer: TextStreamer, sy
                 {"role": "user", "content": f"Error: {extract_message}. Please rephrase your response."}
             )
 
+def generate_structured_responses(generator: pipeline, streamer: TextStreamer, system_prompt: str, user_prompts: List[str], extract_func: Callable[[str], Tuple[str, Optional[Any]]]) -> List[Any]:
+    """
+    Batched version of generate_structured_response.
+    All conversations are sent to the pipeline as one batch, and only the ones that fail
+    extraction are retried in the next batch. Streaming is only used for a single conversation.
+    Generators that cannot batch (no tokenizer to pad with, and not an LLMBackend) get one call per conversation.
+    """
+    conversations = [
+        [
+            {"role": "user", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        for user_prompt in user_prompts
+    ]
+    results = [None] * len(conversations)
+
+    tokenizer = getattr(generator, "tokenizer", None)
+    can_batch = tokenizer is not None or isinstance(generator, LLMBackend)
+    padding_side = tokenizer.padding_side if tokenizer is not None else None
+    if tokenizer is not None and tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    pending = list(range(len(conversations)))
+    while pending:
+        if len(pending) == 1:
+            outputs = [generator(conversations[pending[0]], max_new_tokens=1024, streamer=streamer)]
+        elif not can_batch:
+            outputs = [generator(conversations[i], max_new_tokens=1024) for i in pending]
+        else:
+            # Decoder-only models need left padding for batched generation, restored for the other callers
+            if tokenizer is not None:
+                tokenizer.padding_side = "left"
+            try:
+                outputs = generator([conversations[i] for i in pending], max_new_tokens=1024, batch_size=len(pending))
+            finally:
+                if tokenizer is not None:
+                    tokenizer.padding_side = padding_side
+
+        failed = []
+        for i, output in zip(pending, outputs):
+            conversations[i] = output[0]["generated_text"]
+            extract_message, extracted_data = extract_func(conversations[i][-1]["content"])
+            if extract_message == "success":
+                results[i] = extracted_data
+            else:
+                conversations[i].append(
+                    {"role": "user", "content": f"Error: {extract_message}. Please rephrase your response."}
+                )
+                failed.append(i)
+        pending = failed
+
+    return results
+
 def generate_initial_plan(generator: pipeline, streamer: TextStreamer, question: str, file_path: str = None) -> Plan:
 # def generate_initial_plan(model: AutoModelForCausalLM, tokenizer: AutoTokenizer, question: str, file_path: str = None) -> Plan:
     # build up user prompt
@@ -136,15 +190,20 @@ def generate_initial_plan(generator: pipeline, streamer: TextStreamer, question:
         extract_func=extract_plan
     )
 
-def modify_plan(generator: pipeline, streamer: TextStreamer, plan: Plan, question: str, file_path: str = None) -> ModificationResponse:
-# def modify_plan(model: AutoModelForCausalLM, tokenizer: AutoTokenizer, plan: Plan, question: str, file_path: str = None) -> ModificationResponse:
-    # build up user prompt
+def build_plan_prompts(plans: List[Plan], question: str, file_path: str = None) -> List[str]:
+    """
+    Build the user prompt presenting each plan for the question, shared by the modification and evaluation calls.
+    """
     if file_path:
-        user_prompt = f"Question: {question}\n\nProvided file: {file_path}"
+        question_prompt = f"Question: {question}\n\nProvided file: {file_path}"
     else:
-        user_prompt = f"Question: {question}"
+        question_prompt = f"Question: {question}"
 
-    user_prompt += f"\n\nPlan:\n{plan.model_dump_json(indent=2)}"
+    return [question_prompt + f"\n\nPlan:\n{plan.model_dump_json(indent=2)}" for plan in plans]
+
+def modify_plan(generator: pipeline, streamer: TextStreamer, plan: Plan, question: str, file_path: str = None) -> ModificationResponse:
+# def modify_plan(model: AutoModelForCausalLM, tokenizer: AutoTokenizer, plan: Plan, question: str, file_path: str = None) -> ModificationResponse:
+    user_prompt = build_plan_prompts([plan], question, file_path)[0]
 
     return generate_structured_response(
         generator=generator,
@@ -156,13 +215,7 @@ def modify_plan(generator: pipeline, streamer: TextStreamer, plan: Plan, questio
 
 def evaluate_plan(generator: pipeline, streamer: TextStreamer, plan: Plan, question: str, file_path: str = None) -> PlanScore:
 # def evaluate_plan(model: AutoModelForCausalLM, tokenizer: AutoTokenizer, plan: Plan, question: str, file_path: str = None) -> PlanScore:
-    # build up user prompt
-    if file_path:
-        user_prompt = f"Question: {question}\n\nProvided file: {file_path}"
-    else:
-        user_prompt = f"Question: {question}"
-
-    user_prompt += f"\n\nPlan:\n{plan.model_dump_json(indent=2)}"
+    user_prompt = build_plan_prompts([plan], question, file_path)[0]
 
     return generate_structured_response(
         generator=generator,
@@ -170,4 +223,32 @@ def evaluate_plan(generator: pipeline, streamer: TextStreamer, plan: Plan, quest
         system_prompt=evaluate_plan_prompt,
         user_prompt=user_prompt,
         extract_func=extract_scores
-    )
\ No newline at end of file
+    )
+
+def modify_plans(generator: pipeline, streamer: TextStreamer, plans: List[Plan], question: str, file_path: str = None) -> List[ModificationResponse]:
+    """
+    Generate one modification for each of the given plans in a single batch.
+    """
+    user_prompts = build_plan_prompts(plans, question, file_path)
+
+    return generate_structured_responses(
+        generator=generator,
+        streamer=streamer,
+        system_prompt=expand_prompt,
+        user_prompts=user_prompts,
+        extract_func=extract_modification
+    )
+
+def evaluate_plans(generator: pipeline, streamer: TextStreamer, plans: List[Plan], question: str, file_path: str = None) -> List[PlanScore]:
+    """
+    Score each of the given plans in a single batch.
+    """
+    user_prompts = build_plan_prompts(plans, question, file_path)
+
+    return generate_structured_responses(
+        generator=generator,
+        streamer=streamer,
+        system_prompt=evaluate_plan_prompt,
+        user_prompts=user_prompts,
+        extract_func=extract_scores
+    )
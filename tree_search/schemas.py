@@ -22,6 +22,22 @@ class ModificationResponse(BaseModel):
     action_params: ActionParams = Field(..., description="Parameters for the action taken.")
 
 
+def apply_modification(steps: list[Step], action: ActionType, action_params: ActionParams) -> list[Step]:
+    """
+    Apply a single modification to a list of steps in place and return the list.
+    Out-of-range positions for remove/update are ignored, keep is a no-op.
+    """
+    if action == ActionType.ADD:
+        steps.insert(action_params.position, Step(goal=action_params.goal, instructions=action_params.instructions))
+    elif action == ActionType.REMOVE:
+        if 0 <= action_params.position < len(steps):
+            steps.pop(action_params.position)
+    elif action == ActionType.UPDATE:
+        if 0 <= action_params.position < len(steps):
+            steps[action_params.position] = Step(goal=action_params.goal, instructions=action_params.instructions)
+    return steps
+
+
 class Plan(BaseModel):
     steps: list[Step] = Field(..., description="List of steps in the plan.")
 
@@ -37,14 +53,7 @@ class Plan(BaseModel):
 
         # This is a placeholder implementation. Actual logic will depend on how modifications are defined.
         for mod in modifications:
-            if mod.action == ActionType.ADD:
-                modified_plan.steps.insert(mod.action_params.position, Step(goal=mod.action_params.goal, instructions=mod.action_params.instructions))
-            elif mod.action == ActionType.REMOVE:
-                if 0 <= mod.action_params.position < len(modified_plan.steps):
-                    modified_plan.steps.pop(mod.action_params.position)
-            elif mod.action == ActionType.UPDATE:
-                if 0 <= mod.action_params.position < len(modified_plan.steps):
-                    modified_plan.steps[mod.action_params.position] = Step(goal=mod.action_params.goal, instructions=mod.action_params.instructions)
+            apply_modification(modified_plan.steps, mod.action, mod.action_params)
         # Return the modified plan
         return modified_plan
 
@@ -0,0 +1,94 @@
+import re
+import math
+import threading
+from collections import Counter
+from typing import List, Tuple
+
+import tiktoken
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(model: str = "gpt-4o") -> tiktoken.Encoding:
+    """
+    Return the tiktoken encoder of a model, created once per process.
+    """
+    with _encoders_lock:
+        if model not in _encoders:
+            _encoders[model] = tiktoken.encoding_for_model(model)
+        return _encoders[model]
+
+
+def encode_paragraphs(text: str, model: str = "gpt-4o") -> List[Tuple[str, List[int]]]:
+    """
+    Split text at blank lines into its non-empty paragraphs, each with its tokens.
+    """
+    enc = get_encoder(model)
+    return [
+        (paragraph, enc.encode(paragraph, disallowed_special=()))
+        for paragraph in re.split(r"\n\s*\n", text)
+        if paragraph.strip()
+    ]
+
+
+def split_into_chunks(text: str, max_tokens: int = 4000, model: str = "gpt-4o",
+                      paragraphs: List[Tuple[str, List[int]]] = None) -> List[str]:
+    """
+    Split text into chunks of at most max_tokens tokens, cutting at paragraph boundaries
+    where possible. Paragraphs longer than max_tokens are cut by tokens.
+    paragraphs, from encode_paragraphs(text), saves encoding the text again.
+    """
+    enc = get_encoder(model)
+    if paragraphs is None:
+        paragraphs = encode_paragraphs(text, model)
+    chunks = []
+    current = []
+    current_tokens = 0
+    for paragraph, tokens in paragraphs:
+        if len(tokens) > max_tokens:
+            if current:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            chunks.extend(enc.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens))
+            continue
+        if current_tokens + len(tokens) > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += len(tokens)
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def tokenize_terms(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def bm25_scores(query: str, chunks: List[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """
+    BM25 score of every chunk for the query, with document frequencies taken over the chunks.
+    """
+    query_terms = set(tokenize_terms(query))
+    chunk_terms = [Counter(tokenize_terms(chunk)) for chunk in chunks]
+    if not query_terms or not chunks:
+        return [0.0] * len(chunks)
+
+    average_length = sum(sum(terms.values()) for terms in chunk_terms) / len(chunks) or 1
+    idf = {}
+    for term in query_terms:
+        document_frequency = sum(1 for terms in chunk_terms if term in terms)
+        idf[term] = math.log(1 + (len(chunks) - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    scores = []
+    for terms in chunk_terms:
+        length = sum(terms.values())
+        score = 0.0
+        for term in query_terms:
+            frequency = terms.get(term, 0)
+            if not frequency:
+                continue
+            score += idf[term] * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / average_length))
+        scores.append(score)
+    return scores
@@ -0,0 +1,167 @@
+import os
+import time
+import random
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+# Get the path to the parent folder
+parent_env_path = Path(__file__).resolve().parents[1] / ".env"
+
+# Load the .env file from the parent folder
+load_dotenv(dotenv_path=parent_env_path)
+
+# Status codes worth retrying, everything else is returned to the caller as is
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+class CircuitOpenError(Exception):
+    """Raised when requests to a host are short-circuited after repeated failures."""
+    def __init__(self, host: str, retry_after: float):
+        self.host = host
+        self.retry_after = retry_after
+        super().__init__(f"Circuit open for {host}, retry in {retry_after:.0f}s")
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects requests for reset_timeout
+    seconds, then lets one trial request through (half-open) before closing again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_request(self, host: str):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.reset_timeout:
+                raise CircuitOpenError(host, self.reset_timeout - elapsed)
+            # Half-open: allow a trial request, a failure reopens the circuit for a full period
+            self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class HTTPTransport:
+    """
+    Shared HTTP layer for the visit and search tools.
+
+    Requests go through one keep-alive session with pooled connections, are capped at
+    max_per_host concurrent requests per host, use explicit connect/read timeouts, are retried
+    with exponential backoff and jitter on connection errors and retryable status codes, and are
+    short-circuited per host by a circuit breaker once a host keeps failing.
+    """
+
+    def __init__(self, connect_timeout: float = 10, read_timeout: float = 60, max_retries: int = 3,
+                 backoff_base: float = 1.0, backoff_max: float = 30, max_per_host: int = 8, pool_size: int = 32,
+                 failure_threshold: int = 5, reset_timeout: float = 60):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_per_host = max_per_host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._host_semaphores = {}
+        self._breakers = {}
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_semaphores[host]
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: sleep a random time up to the exponential bound
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method: str, url: str, target_url: str = None, **kwargs) -> requests.Response:
+        """
+        Send a request with retries. Returns the last response (which may have a retryable
+        status code once retries are exhausted), raises the last connection error or timeout,
+        or raises CircuitOpenError when the host is short-circuited.
+        Requests proxied to another site (e.g. a reader service fetching target_url) are
+        short-circuited by the host of target_url, so one failing site does not block the proxy.
+        """
+        host = urlsplit(url).netloc
+        circuit_host = (urlsplit(target_url).netloc or target_url) if target_url else host
+        semaphore = self._semaphore(host)
+        breaker = self._breaker(circuit_host)
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.max_retries):
+            breaker.before_request(circuit_host)
+            try:
+                with semaphore:
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                breaker.record_failure()
+                print(f"Attempt {attempt+1} for {host} failed: {e}")
+                if attempt == self.max_retries - 1:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                print(f"Attempt {attempt+1} for {host} returned status {response.status_code}")
+                if attempt == self.max_retries - 1:
+                    return response
+            time.sleep(self._backoff(attempt))
+
+    def get(self, url: str, target_url: str = None, **kwargs) -> requests.Response:
+        return self.request("GET", url, target_url=target_url, **kwargs)
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HTTPTransport:
+    """
+    Return the process-wide HTTP transport, configured from the environment:
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT (seconds), HTTP_MAX_RETRIES and HTTP_MAX_PER_HOST.
+    """
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = HTTPTransport(
+                connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", 10)),
+                read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", 60)),
+                max_retries=int(os.getenv("HTTP_MAX_RETRIES", 3)),
+                max_per_host=int(os.getenv("HTTP_MAX_PER_HOST", 8)),
+            )
+    return _transport
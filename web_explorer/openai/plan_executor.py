@@ -7,6 +7,7 @@ import json
 from tree_search.schemas import Plan, Step
 
 from web_explorer.utils import extract_action, truncate_markdown, summarize_web_content_by_qwen
+from web_explorer.summarizer import MAX_PAGE_TOKENS
 # import web_explorer.prompts
 from web_explorer.search_api import get_text_search_results
 from web_explorer.visit_api import visit
@@ -15,14 +16,13 @@ from web_explorer.visit_api import visit
 # from schemas import Plan, Step
 # # import prompts
 from web_explorer.prompts import system_prompt
-from web_explorer.utils import encode_image
 # from search_api import get_text_search_results
 # from visit_api import visit
 
 from document_tools.document_parser import DocumentParser
+from document_tools.attachment_input import attachment_messages
 
 # DIRECT_UPLOAD_SUPPORTED_EXTENSIONS = [".pdf", ".txt", ".doc", ".docx", ".json", ".pptx", ".py", ".md"]
-UTF8_EXTENSIONS = [".txt", ".md", ".csv", ".json", ".jsonl", "jsonld", ".xml", ".py"]
 
 
 class PlanRunner:
@@ -57,175 +57,8 @@ class PlanRunner:
 
         extracted_info = []
         search_count = 0
-        input = []
-        if self.file_path:
-            if self.file_path.endswith(".pdf"):
-            # if self.file_path.split(".")[-1] in DIRECT_UPLOAD_SUPPORTED_EXTENSIONS:
-                # Directly upload the file to OpenAI
-                file = openai_client.files.create(
-                    file=open(self.file_path, "rb"),
-                    purpose="user_data"
-                )
-
-                input = [
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_file",
-                                "file_id": file.id,
-                            },
-                            {
-                                "type": "input_text",
-                                "text": initial_user_prompt,
-                            },
-                        ]
-                    }
-                ]
-            elif self.file_path.endswith(".jpg") or self.file_path.endswith(".png") or self.file_path.endswith(".jpeg"):
-                encoded_image = encode_image(self.file_path)
-                image_url = f"data:image/{self.file_path.split('.')[-1]};base64,{encoded_image}"
-
-                input = [
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_image",
-                                "image_url": image_url,
-                            },
-                            {
-                                "type": "input_text",
-                                "text": initial_user_prompt,
-                            }
-                        ]
-                    }
-                ]
-
-            elif self.file_path.split(".")[-1] in UTF8_EXTENSIONS:
-                # Read the file content
-                with open(self.file_path, "r", encoding="utf-8") as f:
-                    file_content = f.read()
-
-                input = [
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_text",
-                                "text": initial_user_prompt + f"\n\nFile content:\n{file_content}",
-                            },
-                        ]
-                    }
-                ]
-
-            elif self.file_path.endswith(".xlsx"):
-                # Parse the Excel file using DocumentParser
-                excel_content = self.document_parser.parse_excel_using_pandas(self.file_path)
-                input = [
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_text",
-                                "text": initial_user_prompt + f"\n\nExcel content:\n{excel_content}",
-                            },
-                        ]
-                    }
-                ]
-
-            elif self.file_path.endswith(".pptx"):
-                # Parse the PPT file using DocumentParser
-                ppt_content = self.document_parser.parse_ppt(self.file_path)
-                joined_content = '\n'.join(ppt_content)
-                input = [
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_text",
-                                "text": initial_user_prompt + f"\n\nPPT content:\n{joined_content}",
-                            },
-                        ]
-                    }
-                ]
-
-            elif self.file_path.endswith(".zip"):
-                # Parse the ZIP file using DocumentParser
-                zip_content = self.document_parser.parse_zip(self.file_path)
-                zip_content_str = "\n".join([f"{file}: {content}" for item in zip_content for file, content in item.items()])
-                input = [
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_text",
-                                "text": initial_user_prompt + f"\n\nZIP content:\n{zip_content_str}",
-                            },
-                        ]
-                    }
-                ]
-
-            else:
-                input = [
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_text",
-                                "text": initial_user_prompt + f"\n\nFile path:\n{self.file_path}\nThis file type is not supported for direct upload. If you can't solve the question without the file, please use <finalize> to output an approximated answer.",
-                            },
-                        ]
-                    }
-                ]
-        else:
-            input = [
-                {
-                    "role": "system",
-                    "content": system_prompt,
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        # {
-                        #     "type": "input_file",
-                        #     "file_id": file.id,
-                        # },
-                        {
-                            "type": "input_text",
-                            "text": initial_user_prompt,
-                        }
-                    ]
-                }
-            ]
+        input = attachment_messages(openai_client, initial_user_prompt, self.file_path, system_prompt,
+                                    parser=self.document_parser)
 
         # Record actions taken
         actions = []
@@ -279,7 +112,7 @@ class PlanRunner:
                 if action[1] in visit_cache:
                     raw_content = visit_cache[action[1]]
                     print("WARNING: repeated visit")
-                    short_content = truncate_markdown(raw_content, max_tokens=20000)
+                    short_content = truncate_markdown(raw_content, max_tokens=MAX_PAGE_TOKENS)
                     web_summary = summarize_web_content_by_qwen(
                         step.goal, short_content, qwen_client
                     )
@@ -288,7 +121,7 @@ class PlanRunner:
                     raw_content = visit(action[1])
                     visit_cache[action[1]] = raw_content
                 # raw_content = visit(action[1])
-                    short_content = truncate_markdown(raw_content, max_tokens=20000)
+                    short_content = truncate_markdown(raw_content, max_tokens=MAX_PAGE_TOKENS)
                     web_summary = summarize_web_content_by_qwen(
                         step.goal, short_content, qwen_client
                     )
@@ -386,58 +219,8 @@ class PlanRunner:
             finalize_answer_prompt += "Please finalize the answer to the question according to the previous steps and their results:\n"
 
             print("\nFinalizing answer...")
-            input = []
-            if self.file_path and self.file_path.endswith(".pdf"):
-            # if self.file_path.split(".")[-1] in DIRECT_UPLOAD_SUPPORTED_EXTENSIONS:
-                file = openai_client.files.create(
-                    file=open(self.file_path, "rb"),
-                    purpose="user_data"
-                )
-                input = [{
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_file",
-                            "file_id": file.id,
-                        },
-                        {
-                            "type": "input_text",
-                            "text": finalize_answer_prompt,
-                        },
-                    ]
-                }]
-
-            elif self.file_path and (self.file_path.endswith(".jpg") or self.file_path.endswith(".png") or self.file_path.endswith(".jpeg")):
-                encoded_image = encode_image(self.file_path)
-                image_url = f"data:image/{self.file_path.split('.')[-1]};base64,{encoded_image}"
-
-                input = [{
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_image",
-                            "image_url": image_url,
-                        },
-                        {
-                            "type": "input_text",
-                            "text": finalize_answer_prompt,
-                        },
-                    ]
-                }]
-            else:
-                input = [{
-                    "role": "user",
-                    "content": [
-                        # {
-                        #     "type": "input_file",
-                        #     "file_id": file.id,
-                        # },
-                        {
-                            "type": "input_text",
-                            "text": finalize_answer_prompt,
-                        },
-                    ]
-                }]
+            # Only files the model reads natively (PDFs and images) are attached to the finalization
+            input = attachment_messages(openai_client, finalize_answer_prompt, self.file_path, include_text=False)
             response = openai_client.responses.create(
                 model=model,
                 input=input
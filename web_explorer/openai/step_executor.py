@@ -5,14 +5,17 @@ import json
 from openai import OpenAI
 # import base64
 
-from web_explorer.prompts import system_prompt
-from web_explorer.utils import encode_image, extract_action, truncate_markdown, summarize_web_content_by_qwen
+from web_explorer.prompts import system_prompt, concurrent_system_prompt
+from web_explorer.utils import extract_action, extract_actions, truncate_markdown, digest_web_content
+from web_explorer.summarizer import MAX_PAGE_TOKENS
 from web_explorer.search_api import get_text_search_results
 from web_explorer.visit_api import visit
+from web_explorer.tool_dispatch import run_concurrent_actions
+from document_tools.attachment_input import attachment_messages
 
 
 class StepExecutor:
-    def __init__(self, question: str, current_step: Step, openai_client: OpenAI, qwen_client: OpenAI, finished_steps: List[Tuple[Step, str]] = None, file_path: str = None, model: str = "gpt-4o-mini"):
+    def __init__(self, question: str, current_step: Step, openai_client: OpenAI, qwen_client: OpenAI, finished_steps: List[Tuple[Step, str]] = None, file_path: str = None, model: str = "gpt-4o-mini", concurrent_tools: bool = False, visit_mode: str = "summarize"):
         self.question = question
         self.finished_steps = finished_steps
         self.current_step = current_step
@@ -20,6 +23,12 @@ class StepExecutor:
         self.model = model
         self.openai_client = openai_client
         self.qwen_client = qwen_client
+        # Let the model issue several search/visit actions per turn and run them concurrently
+        self.concurrent_tools = concurrent_tools
+        # "summarize" visited pages with the summarizer model, or "extract" their most relevant passages
+        self.visit_mode = visit_mode
+        # Prompt tokens served from the provider's prompt cache and prefilled, over the turns of the step
+        self.prefill_tokens = {"reused": 0, "new": 0}
 
     def run(self):
         # build up user query
@@ -31,104 +40,15 @@ class StepExecutor:
                 previous_steps += f"Step: {step.goal}\nAnswer: {answer}\n\n"
 
         user_query = f"Question: {self.question}\n\nPrevious steps and results:\n{previous_steps}Current step: {self.current_step.goal}\n\nInstructions: {self.current_step.instructions}\n\n"
-        user_prompt += "Stick to the current step during execution, use <answer> immediately when you gather enough info for the step, don't rush to solve the whole question!"
+        user_query += "Stick to the current step during execution, use <answer> immediately when you gather enough info for the step, don't rush to solve the whole question!"
+
+        step_system_prompt = concurrent_system_prompt if self.concurrent_tools else system_prompt
 
         # Start execution
         extracted_info = []
         search_count = 0
         visit_count = 0
-        if self.file_path:
-            if self.file_path.endswith(".pdf"):
-                # Directly upload the file to OpenAI
-                file = self.openai_client.files.create(
-                    file=open(self.file_path, "rb"),
-                    purpose="user_data"
-                )
-
-                input = [
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_file",
-                                "file_id": file.id,
-                            },
-                            {
-                                "type": "input_text",
-                                "text": user_query,
-                            },
-                        ]
-                    }
-                ]
-
-            elif self.file_path.endswith(".jpg") or self.file_path.endswith(".png") or self.file_path.endswith(".jpeg"):
-                encoded_image = encode_image(self.file_path)
-                image_url = f"data:image/{self.file_path.split('.')[-1]};base64,{encoded_image}"
-
-                input = [
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_image",
-                                "image_url": image_url,
-                            },
-                            {
-                                "type": "input_text",
-                                "text": user_query,
-                            }
-                        ]
-                    }
-                ]
-
-            else:
-                from document_tools.document_parser import DocumentParser
-                document_parser = DocumentParser()
-                document_content = document_parser.parse_file(self.file_path)
-                input = [
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_text",
-                                "text": user_query + f"\n\nDocument content:\n{document_content}",
-                            },
-                        ]
-                    }
-                ]
-
-        else:
-            input = [
-                {
-                    "role": "system",
-                    "content": system_prompt,
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        # {
-                        #     "type": "input_file",
-                        #     "file_id": file.id,
-                        # },
-                        {
-                            "type": "input_text",
-                            "text": user_query,
-                        }
-                    ]
-                }
-            ]
+        input = attachment_messages(self.openai_client, user_query, self.file_path, step_system_prompt)
 
         # Record actions taken
         actions = []
@@ -140,11 +60,21 @@ class StepExecutor:
                 model=self.model,
                 input=input
             )
+            self._record_prefill(response)
 
             text = response.output_text
 
             print(f"Response from model: {text}")
 
+            # run several search/visit actions of one response concurrently
+            if self.concurrent_tools:
+                tool_actions = extract_actions(text)
+                if len(tool_actions) > 1:
+                    search_count, visit_count = self._handle_concurrent_actions(
+                        tool_actions, search_count, visit_count, search_cache, visit_cache, input, actions
+                    )
+                    continue
+
             # execute action
             action = extract_action(text)
             # actions.append(action)
@@ -195,18 +125,18 @@ class StepExecutor:
                 if action[1] in visit_cache:
                     raw_content = visit_cache[action[1]]
                     # print("WARNING: repeated visit")
-                    short_content = truncate_markdown(raw_content, max_tokens=20000)
-                    web_summary = summarize_web_content_by_qwen(
-                        topic, short_content, self.qwen_client
+                    short_content = truncate_markdown(raw_content, max_tokens=MAX_PAGE_TOKENS)
+                    web_summary = digest_web_content(
+                        topic, short_content, self.qwen_client, self.visit_mode
                     )
                     user_prompt = "WARNING: repeated visit\n" + "Here's a summary of the requested website:\n```web_content\n" + str(web_summary) + "\n```"
                 else:
                     raw_content = visit(action[1])
                     visit_cache[action[1]] = raw_content
                 # raw_content = visit(action[1])
-                    short_content = truncate_markdown(raw_content, max_tokens=20000)
-                    web_summary = summarize_web_content_by_qwen(
-                        topic, short_content, self.qwen_client
+                    short_content = truncate_markdown(raw_content, max_tokens=MAX_PAGE_TOKENS)
+                    web_summary = digest_web_content(
+                        topic, short_content, self.qwen_client, self.visit_mode
                     )
                     user_prompt = "Here's a summary of the requested website:\n```web_content\n" + str(web_summary) + "\n```"
                 input.append({
@@ -237,8 +167,10 @@ class StepExecutor:
                     "found_relevant_info": extracted_info,
                     "search_count": search_count,
                     "visit_count": visit_count,
-                    "actions": actions
+                    "actions": actions,
+                    "prefill_tokens": self.prefill_tokens
                 }
+                print(f"Prompt tokens reused from the prompt cache: {self.prefill_tokens['reused']}, prefilled: {self.prefill_tokens['new']}")
                 # self.finished_steps.append(step_results)
                 return step_results
             # elif action[0] == "finalize":
@@ -255,4 +187,30 @@ class StepExecutor:
                     "role": "user",
                     "content": "The response format is invalid, you must include the available action markers: <search>, <visit>, <extract>, <answer>"
                 })
-                continue
\ No newline at end of file
+                continue
+
+    def _record_prefill(self, response):
+        """
+        Add the prompt tokens of a response to the prefill counts. The input of a step only grows by appending
+        turns after the static system prompt, attachment and step prompt, so the provider can serve the
+        previous turns from its prompt cache.
+        """
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        details = getattr(usage, "input_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        self.prefill_tokens["reused"] += cached_tokens
+        self.prefill_tokens["new"] += usage.input_tokens - cached_tokens
+
+    def _handle_concurrent_actions(self, tool_actions, search_count, visit_count, search_cache, visit_cache, input, actions):
+        """
+        Run the search/visit actions of one response concurrently and answer them with a single user message.
+        Returns the updated counts.
+        """
+        user_prompt, search_count, visit_count = run_concurrent_actions(
+            tool_actions, self.current_step.goal, self.qwen_client, search_cache, visit_cache, actions,
+            search_count, visit_count, max_searches=10, max_visits=20, visit_mode=self.visit_mode
+        )
+        input.append({"role": "user", "content": user_prompt})
+        return search_count, visit_count
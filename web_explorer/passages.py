@@ -0,0 +1,55 @@
+import re
+from typing import Callable, List
+
+import numpy as np
+
+from web_explorer.chunking import split_into_chunks, bm25_scores
+
+LINK_PATTERN = re.compile(r"\[([^\]]*)\]\((https?://[^)\s]+)\)")
+
+
+def rank_passages(topic: str, content: str, top_k: int = 5, chunk_tokens: int = 300,
+                  embed_fn: Callable[[List[str]], List[List[float]]] = None, rerank_candidates: int = 20) -> List[str]:
+    """
+    Return the top_k passages of content most relevant to the topic, best first.
+
+    Passages are ranked with BM25. With an embedding function (list of texts -> list of vectors),
+    the best rerank_candidates BM25 passages are reranked by cosine similarity to the topic.
+    Without any lexical match, the first passages of the page are returned.
+    """
+    passages = split_into_chunks(content, max_tokens=chunk_tokens)
+    if len(passages) <= top_k and not embed_fn:
+        return passages
+
+    scores = bm25_scores(topic, passages)
+    ranked = [i for i in sorted(range(len(passages)), key=lambda i: scores[i], reverse=True) if scores[i] > 0]
+    if not ranked:
+        return passages[:top_k]
+
+    if embed_fn:
+        candidates = ranked[:rerank_candidates]
+        vectors = np.asarray(embed_fn([topic] + [passages[i] for i in candidates]), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        similarities = vectors[1:] @ vectors[0]
+        ranked = [candidates[i] for i in np.argsort(-similarities)]
+
+    return [passages[i] for i in ranked[:top_k]]
+
+
+def extract_relevant_passages(topic: str, content: str, top_k: int = 5, chunk_tokens: int = 300,
+                              embed_fn: Callable[[List[str]], List[List[float]]] = None) -> str:
+    """
+    Format the passages of a page most relevant to the topic, with the links they contain,
+    as a replacement of an LLM summary of the page.
+    """
+    passages = rank_passages(topic, content, top_k=top_k, chunk_tokens=chunk_tokens, embed_fn=embed_fn)
+    if not passages:
+        return "The website has no content."
+
+    result = f"Top {len(passages)} passages of the website relevant to '{topic}':\n"
+    for i, passage in enumerate(passages):
+        result += f"\n[Passage {i + 1}]\n{passage.strip()}\n"
+        links = LINK_PATTERN.findall(passage)
+        if links:
+            result += "Links: " + ", ".join(f"{text.strip() or url} ({url})" for text, url in links) + "\n"
+    return result
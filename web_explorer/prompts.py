@@ -2,7 +2,14 @@ from datetime import date
 
 today = date.today()
 
-system_prompt = f"""You are an information-seeking expert that can search the web, visit websites, and extract information.  
+one_action_rule = '- Only one action at a time, responses like "<search>...</search> ... <extract>...</extract>" is illegal.'
+
+# For executors that run several tool calls per turn concurrently
+concurrent_actions_rule = '- You may give several <search> and <visit> actions in one response, they run in parallel and all results are returned together. Any other action must be the only action of its response.'
+
+
+def build_system_prompt(action_rule: str = one_action_rule) -> str:
+    return f"""You are an information-seeking expert that can search the web, visit websites, and extract information.  
 
 You are given:
 - A question
@@ -22,7 +29,7 @@ Your task:
 
 **Rules:**  
 - Always show <think> before an action.  
-- Only one action at a time, responses like "<search>...</search> ... <extract>...</extract>" is illegal.
+{action_rule}
 - Always give a <topic> when <visit>.
 - Always <extract> when you encounter relevant information.
 - Always give <reference> when <answer>.
@@ -52,3 +59,7 @@ Your task:
 <reference>...</reference>
 """
 
+
+system_prompt = build_system_prompt(one_action_rule)
+
+concurrent_system_prompt = build_system_prompt(concurrent_actions_rule)
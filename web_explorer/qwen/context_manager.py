@@ -0,0 +1,180 @@
+import hashlib
+from typing import Callable, Dict, List
+
+
+# Marker of the messages a step execution must not lose to eviction
+EXTRACT_MARKERS = ("<extract>", "Recent extractions")
+
+# Markers of tool output messages (search results and website summaries)
+TOOL_OUTPUT_MARKERS = ("```search_results", "```web_content")
+
+
+class ContextManager:
+    """
+    Token accounting and eviction for a step execution conversation.
+
+    Messages are counted with the tokenizer of the generator, and each count is cached by the hash of
+    the message, so every message is tokenized once no matter how many turns it stays in the context.
+    Without a tokenizer (e.g. a remote backend), counts fall back to 4 characters per token.
+
+    fit() applies the eviction policies in order until the conversation fits the prompt budget
+    (max_context_tokens minus the tokens reserved for generation). If the policies are not enough,
+    the oldest messages after the system and initial user messages are dropped and finally the
+    longest remaining message is cut, so the result always fits.
+    """
+
+    def __init__(self, tokenizer=None, max_context_tokens: int = 16000, reserve_tokens: int = 1024,
+                 policies: List["EvictionPolicy"] = None):
+        self.tokenizer = tokenizer
+        self.max_context_tokens = max_context_tokens
+        self.reserve_tokens = reserve_tokens
+        self.policies = policies or []
+        self._counts = {}
+        self.message_overhead = self._message_overhead()
+
+    @property
+    def budget(self) -> int:
+        return self.max_context_tokens - self.reserve_tokens
+
+    def _message_overhead(self) -> int:
+        """
+        Tokens the chat template adds around a message, measured once as the cost of a second empty message,
+        so what the template adds once per conversation (e.g. a default system prompt) is not counted per message.
+        """
+        if self.tokenizer is None or not getattr(self.tokenizer, "chat_template", None):
+            return 8
+        try:
+            empty = {"role": "user", "content": ""}
+            one = self.tokenizer.apply_chat_template([empty], tokenize=True)
+            two = self.tokenizer.apply_chat_template([empty, empty], tokenize=True)
+            return max(len(two) - len(one), 1)
+        except Exception:
+            return 8
+
+    def count_text(self, text: str) -> int:
+        if self.tokenizer is None:
+            return len(text) // 4
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def count(self, message: Dict) -> int:
+        content = str(message.get("content", ""))
+        key = hashlib.sha1(f"{message.get('role')}\n{content}".encode("utf-8")).hexdigest()
+        if key not in self._counts:
+            self._counts[key] = self.count_text(content) + self.message_overhead
+        return self._counts[key]
+
+    def total(self, messages: List[Dict]) -> int:
+        return sum(self.count(message) for message in messages)
+
+    def fits(self, messages: List[Dict]) -> bool:
+        return self.total(messages) <= self.budget
+
+    def truncate_text(self, text: str, max_tokens: int) -> str:
+        suffix = "\n... [truncated for context limits]"
+        if max_tokens <= 0:
+            return suffix.strip()
+        if self.tokenizer is None:
+            return text[:max_tokens * 4] + suffix
+        tokens = self.tokenizer.encode(text, add_special_tokens=False)
+        return self.tokenizer.decode(tokens[:max_tokens]) + suffix
+
+    def fit(self, messages: List[Dict], state: Dict = None) -> List[Dict]:
+        """
+        Return messages evicted down to the prompt budget. state carries the execution state
+        (actions, extracted_info) the policies may use.
+        """
+        state = state or {}
+        for policy in self.policies:
+            if self.fits(messages):
+                return messages
+            messages = policy.apply(messages, self, state)
+
+        if self.fits(messages):
+            return messages
+
+        # Last resort: drop the oldest messages, then cut the longest one
+        messages = list(messages)
+        while len(messages) > 3 and not self.fits(messages):
+            messages.pop(2)
+        while not self.fits(messages):
+            longest = max(range(len(messages)), key=lambda i: self.count(messages[i]))
+            longest_count = self.count(messages[longest])
+            if longest_count <= self.message_overhead + 16:
+                # Nothing left to cut
+                break
+            keep_tokens = longest_count - self.message_overhead - (self.total(messages) - self.budget) - 16
+            content = str(messages[longest]["content"])
+            messages[longest] = {**messages[longest], "content": self.truncate_text(content, keep_tokens)}
+        return messages
+
+
+class EvictionPolicy:
+    """
+    A strategy to shrink a conversation that no longer fits the context.
+    Messages 0 and 1 (system prompt and initial user prompt) are never evicted.
+    """
+
+    def apply(self, messages: List[Dict], context: ContextManager, state: Dict) -> List[Dict]:
+        raise NotImplementedError("This method should be implemented by subclasses.")
+
+
+class DropOldToolOutputs(EvictionPolicy):
+    """
+    Replace the content of old search results and website summaries with a short note,
+    oldest first, keeping the last keep_last tool outputs intact.
+    """
+
+    def __init__(self, keep_last: int = 2):
+        self.keep_last = keep_last
+
+    def apply(self, messages, context, state):
+        messages = list(messages)
+        tool_outputs = [
+            i for i, message in enumerate(messages)
+            if i > 1 and message["role"] == "user" and any(marker in str(message["content"]) for marker in TOOL_OUTPUT_MARKERS)
+        ]
+        evictable = tool_outputs[:-self.keep_last] if self.keep_last > 0 else tool_outputs
+        for i in evictable:
+            if context.fits(messages):
+                break
+            messages[i] = {**messages[i], "content": "[Tool output removed to save context, see the summary of previous actions.]"}
+        return messages
+
+
+class KeepExtracts(EvictionPolicy):
+    """
+    Drop the oldest messages, but keep every message holding extracted information.
+    """
+
+    def __init__(self, preserve_count: int = 2):
+        self.preserve_count = preserve_count
+
+    def apply(self, messages, context, state):
+        messages = list(messages)
+        i = 2
+        while i < len(messages) - self.preserve_count * 2 and not context.fits(messages):
+            if any(marker in str(messages[i]["content"]) for marker in EXTRACT_MARKERS):
+                i += 1
+                continue
+            messages.pop(i)
+        return messages
+
+
+class SummarizeHistory(EvictionPolicy):
+    """
+    Keep the system message, the initial user prompt and the last preserve_count exchanges,
+    and insert a summary of the previous actions built by summarize(actions, extracted_info).
+    """
+
+    def __init__(self, summarize: Callable[[list, list], str], preserve_count: int = 2):
+        self.summarize = summarize
+        self.preserve_count = preserve_count
+
+    def apply(self, messages, context, state):
+        if len(messages) <= self.preserve_count * 2 + 2:
+            return messages
+        messages = messages[:2] + messages[-(self.preserve_count * 2):]
+        context_summary = self.summarize(state.get("actions", []), state.get("extracted_info", []))
+        if context_summary:
+            messages.insert(-1, {"role": "user", "content": context_summary})
+        return messages
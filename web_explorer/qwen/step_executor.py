@@ -9,16 +9,22 @@ import torch
 
 from transformers import pipeline, TextStreamer
 
-from web_explorer.prompts import system_prompt
-from web_explorer.utils import extract_action, truncate_markdown, summarize_web_content_by_qwen
+from web_explorer.prompts import system_prompt, concurrent_system_prompt
+from web_explorer.utils import extract_action, extract_actions, truncate_markdown, digest_web_content
+from web_explorer.summarizer import MAX_PAGE_TOKENS
 from web_explorer.search_api import get_text_search_results
 from web_explorer.visit_api import visit
+from web_explorer.tool_dispatch import run_concurrent_actions
+from web_explorer.qwen.context_manager import ContextManager, EvictionPolicy, DropOldToolOutputs, SummarizeHistory
+from llm.prefix_cache import create_prefix_session
 
-from document_tools.document_parser import DocumentParser
+from document_tools.attachment_cache import parse_file_cached
 
 class StepExecutor:
     def __init__(self, question: str, generator: pipeline, streamer: TextStreamer, current_step: Step, qwen_client: OpenAI, 
-                 finished_steps: List[Tuple[Step, str]] = None, file_path: str = None, max_context_tokens: int = 16000):
+                 finished_steps: List[Tuple[Step, str]] = None, file_path: str = None, max_context_tokens: int = 16000,
+                 concurrent_tools: bool = False, eviction_policies: List[EvictionPolicy] = None, visit_mode: str = "summarize",
+                 reuse_prefix: bool = False):
         self.question = question
         self.generator = generator
         self.streamer = streamer
@@ -27,22 +33,28 @@ class StepExecutor:
         self.file_path = file_path
         self.qwen_client = qwen_client
         self.max_context_tokens = max_context_tokens
+        # Let the model issue several search/visit actions per turn and run them concurrently
+        self.concurrent_tools = concurrent_tools
+        # "summarize" visited pages with the summarizer model, or "extract" their most relevant passages
+        self.visit_mode = visit_mode
+        # Keep the KV cache of the conversation between turns, only the new tokens of each turn are prefilled
+        self.prefix_session = create_prefix_session(generator) if reuse_prefix else None
+        if self.prefix_session:
+            self.generator = self.prefix_session
+        # Token counts with the generator's tokenizer, evicting old context to fit max_context_tokens
+        if eviction_policies is None:
+            eviction_policies = [DropOldToolOutputs(keep_last=2), SummarizeHistory(self.create_context_summary, preserve_count=2)]
+        self.context = ContextManager(
+            tokenizer=getattr(generator, "tokenizer", None),
+            max_context_tokens=max_context_tokens,
+            # The largest generation of the executor (the forced final summary)
+            reserve_tokens=2048,
+            policies=eviction_policies
+        )
         
     def estimate_tokens(self, text: str) -> int:
-        """Rough token estimation (4 chars ≈ 1 token)"""
-        return len(text) // 4
-    
-    def truncate_old_messages(self, messages: list, preserve_count: int = 3) -> list:
-        """Keep system message, initial user prompt, and last N exchanges"""
-        if len(messages) <= preserve_count + 2:  # +2 for system and initial user
-            return messages
-        
-        # Always keep: system message, initial user message, last N exchanges
-        system_msg = messages[0]
-        initial_user = messages[1]
-        recent_messages = messages[-(preserve_count * 2):]  # Last N exchanges (user + assistant pairs)
-        
-        return [system_msg, initial_user] + recent_messages
+        """Token count of text with the generator's tokenizer (4 chars ≈ 1 token without one)"""
+        return self.context.count_text(text)
     
     def create_context_summary(self, actions: list, extracted_info: list) -> str:
         """Create a compact summary of previous actions"""
@@ -89,8 +101,7 @@ class StepExecutor:
 
         # Parse file content (truncate if too long)
         if self.file_path:
-            parser = DocumentParser()
-            file_content = parser.parse_file(file_path=self.file_path)
+            file_content = parse_file_cached(self.file_path)
             if self.estimate_tokens(file_content) > 5000:
                 file_content = file_content[:20000] + "\n... [File truncated for context limits]"
             user_prompt += f"\n\nFile content:\n{file_content}"
@@ -104,7 +115,7 @@ class StepExecutor:
         visit_cache = {}
         
         messages = [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": concurrent_system_prompt if self.concurrent_tools else system_prompt},
             {"role": "user", "content": user_prompt}
         ]
 
@@ -114,15 +125,8 @@ class StepExecutor:
         while iteration_count < max_iterations:
             iteration_count += 1
             
-            # Context management: truncate messages if getting too long
-            total_context = sum(self.estimate_tokens(str(msg)) for msg in messages)
-            if total_context > self.max_context_tokens:
-                messages = self.truncate_old_messages(messages, preserve_count=2)
-                
-                # Add context summary
-                context_summary = self.create_context_summary(actions, extracted_info)
-                if context_summary:
-                    messages.insert(-1, {"role": "user", "content": context_summary})
+            # Context management: evict old context until the prompt fits
+            messages = self.context.fit(messages, {"actions": actions, "extracted_info": extracted_info})
             
             # Generate response
             print(f"Current message stream length: {len(messages)}")
@@ -144,6 +148,17 @@ class StepExecutor:
             # Add assistant response to messages
             messages.append({"role": "assistant", "content": response})
             
+            # Run several search/visit actions of one response concurrently
+            if self.concurrent_tools:
+                tool_actions = extract_actions(response)
+                if len(tool_actions) > 1:
+                    search_count, visit_count = self._handle_concurrent_actions(
+                        tool_actions, search_count, visit_count, search_cache, visit_cache, messages, actions
+                    )
+                    if search_count >= 5 or visit_count >= 10:
+                        break
+                    continue
+
             # Execute action
             action = extract_action(response)
             if not action:
@@ -230,15 +245,15 @@ class StepExecutor:
                 topic = self.current_step.goal
         if url in visit_cache:
             web_content = visit_cache[url]
-            web_summary = summarize_web_content_by_qwen(topic, web_content, self.qwen_client)
+            web_summary = digest_web_content(topic, web_content, self.qwen_client, self.visit_mode)
             user_prompt = "CACHED VISIT:\n"
             user_prompt += f"Website summary:\n```web_content\n{str(web_summary)}\n```"
         else:
             raw_content = visit(url)
-            short_content = truncate_markdown(raw_content)  # Reduced token limit
+            short_content = truncate_markdown(raw_content, max_tokens=MAX_PAGE_TOKENS)
             # pre define topic
             # topic = self.current_step.goal
-            web_summary = summarize_web_content_by_qwen(topic, short_content, self.qwen_client)
+            web_summary = digest_web_content(topic, short_content, self.qwen_client, self.visit_mode)
             user_prompt = f"Website summary:\n```web_content\n{str(web_summary)}\n```"  # Truncate summary
             visit_cache[url] = short_content
         
@@ -251,6 +266,19 @@ class StepExecutor:
         actions.append(action_step)
         return True
     
+    def _handle_concurrent_actions(self, tool_actions, search_count, visit_count, search_cache, visit_cache, messages, actions):
+        """
+        Run the search/visit actions of one response concurrently and answer them with a single user message.
+        Returns the updated counts.
+        """
+        # The step loop stops after 5 searches or 10 visits, so one response cannot run more than that
+        user_prompt, search_count, visit_count = run_concurrent_actions(
+            tool_actions, self.current_step.goal, self.qwen_client, search_cache, visit_cache, actions,
+            search_count, visit_count, max_searches=5, max_visits=10, visit_mode=self.visit_mode
+        )
+        messages.append({"role": "user", "content": user_prompt})
+        return search_count, visit_count
+
     def _handle_extract_action(self, action, extracted_info, messages, actions, action_step):
         extracted_info.append(action[1])
         # Only show recent extractions to save context
@@ -294,6 +322,7 @@ Please provide a comprehensive summary of what you have found relevant to the cu
         
         # Add the summary prompt
         messages.append({"role": "user", "content": summary_prompt})
+        messages = self.context.fit(messages, {"actions": actions, "extracted_info": extracted_info})
         
         # Get model's final response
         try:
@@ -340,6 +369,10 @@ Please provide a comprehensive summary of what you have found relevant to the cu
             "visit_count": len([a for a in actions if a["action"] == "visit"]),
             "actions": actions
         }
+        if self.prefix_session:
+            step_results["prefill_tokens"] = {"reused": self.prefix_session.reused_tokens, "new": self.prefix_session.new_tokens}
+            print(f"Prompt tokens reused from the KV cache: {self.prefix_session.reused_tokens}, prefilled: {self.prefix_session.new_tokens}")
+            self.prefix_session.reset()
         # self.finished_steps.append(step_results)
         return step_results
     
@@ -1,11 +1,11 @@
 import os
-import time
 from pathlib import Path
 
-from serpapi import GoogleSearch
-
 from dotenv import load_dotenv
 
+from web_explorer.search_cache import get_search_cache
+from web_explorer.http_transport import get_transport
+
 # Get the path to the parent folder
 parent_env_path = Path(__file__).resolve().parents[1] / ".env"
 
@@ -14,7 +14,14 @@ load_dotenv(dotenv_path=parent_env_path)
 
 API_KEY = os.getenv("SERP_API_KEY")
 # print(f"Using SERP API Key: {API_KEY}")
-retry_attempt = 3
+SERPAPI_URL = "https://serpapi.com/search.json"
+
+def serpapi_search(params: dict) -> dict:
+    """
+    Query SerpAPI through the shared HTTP transport (pooled connections, timeouts, retries with backoff).
+    """
+    response = get_transport().get(SERPAPI_URL, params=params)
+    return response.json()
 
 def get_text_search_results(query, num_results=10):
     params = {
@@ -23,31 +30,36 @@ def get_text_search_results(query, num_results=10):
         "api_key": API_KEY,
         "num": num_results,
     }
-    for i in range(retry_attempt):
-        try:
-            search = GoogleSearch(params)
-            # debug: 
-            # print(search.get_dict())
-            organic_results = search.get_dict().get("organic_results", [])
-            if not organic_results:
-                return (f"No results found for query: {query}")
-            parsed_results = []
-            for result in organic_results:
-                parsed_result = {
-                    "title": result.get("title"),
-                    "link": result.get("link"),
-                    "snippet": result.get("snippet"),
-                    "displayed_link": result.get("displayed_link"),
-                }
-                parsed_results.append(parsed_result)
-            return parsed_results
-        except Exception as e:
-            print(f"Attempt {i+1} failed: {e}")
-            if i < retry_attempt - 1:
-                time.sleep(2)
-            else:
-                print("All retries failed.")
-                return ("Connection error to the search engine. Please try again later.")
+
+    # Check the shared on-disk cache first
+    search_cache = get_search_cache()
+    cached_results = search_cache.get(query, params)
+    if cached_results is not None:
+        return cached_results
+    if search_cache.mode == "replay":
+        return (f"No cached results for query: {query}")
+
+    try:
+        # debug: 
+        # print(serpapi_search(params))
+        organic_results = serpapi_search(params).get("organic_results", [])
+    except Exception as e:
+        print(f"Search request failed: {e}")
+        return ("Connection error to the search engine. Please try again later.")
+
+    if not organic_results:
+        return (f"No results found for query: {query}")
+    parsed_results = []
+    for result in organic_results:
+        parsed_result = {
+            "title": result.get("title"),
+            "link": result.get("link"),
+            "snippet": result.get("snippet"),
+            "displayed_link": result.get("displayed_link"),
+        }
+        parsed_results.append(parsed_result)
+    search_cache.set(query, params, parsed_results)
+    return parsed_results
             
 def get_image_search_results(image_path, num_results=10):
     params = {
@@ -57,21 +69,16 @@ def get_image_search_results(image_path, num_results=10):
     "api_key": API_KEY
     }
 
-    for i in range(retry_attempt):
-        try:
-            search = GoogleSearch(params)
-            organic_results = search.get_dict().get("visual_matches", [])
-            if not organic_results:
-                return (f"No results found for image: {image_path}")
-            if len(organic_results) < num_results:
-                return organic_results
-            # Limit the number of results to num_results
-            parsed_results = organic_results[:num_results]
-            return parsed_results
-        except Exception as e:
-            print(f"Attempt {i+1} failed: {e}")
-            if i < retry_attempt - 1:
-                time.sleep(2)
-            else:
-                print("All retries failed.")
-                return ("Connection error to the search engine. Please try again later.")
\ No newline at end of file
+    try:
+        organic_results = serpapi_search(params).get("visual_matches", [])
+    except Exception as e:
+        print(f"Search request failed: {e}")
+        return ("Connection error to the search engine. Please try again later.")
+
+    if not organic_results:
+        return (f"No results found for image: {image_path}")
+    if len(organic_results) < num_results:
+        return organic_results
+    # Limit the number of results to num_results
+    parsed_results = organic_results[:num_results]
+    return parsed_results
@@ -0,0 +1,138 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Get the path to the parent folder
+parent_env_path = Path(__file__).resolve().parents[1] / ".env"
+
+# Load the .env file from the parent folder
+load_dotenv(dotenv_path=parent_env_path)
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parents[1] / "cache" / "search_cache.sqlite"
+
+# Cache modes:
+# - "readwrite": serve hits from the cache and store new results (default)
+# - "replay": serve hits from the cache only, misses are not sent to the search engine
+# - "off": bypass the cache
+CACHE_MODES = ["readwrite", "replay", "off"]
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class SearchCache:
+    """
+    Persistent search result cache shared by all processes using the same SQLite file.
+
+    Entries are keyed by the normalized query plus the engine parameters (without the API key),
+    expire after ttl seconds, and the least recently used entries are evicted once the cache
+    holds more than max_entries results.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = 7 * 24 * 3600, max_entries: int = 100000, mode: str = "readwrite"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown search cache mode: {mode}, must be one of {CACHE_MODES}")
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if self.mode != "off":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "key TEXT PRIMARY KEY, query TEXT, params TEXT, result TEXT, "
+                "created_at REAL, last_access REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON search_cache (last_access)")
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(query: str, params: dict) -> str:
+        key_params = {k: v for k, v in params.items() if k not in ("q", "api_key")}
+        key_params["q"] = normalize_query(query)
+        return hashlib.sha256(json.dumps(key_params, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, query: str, params: dict):
+        """
+        Return the cached result, or None on a miss or an expired entry.
+        """
+        if self.mode == "off":
+            return None
+
+        key = self.make_key(query, params)
+        with self._lock:
+            row = self._conn.execute("SELECT result, created_at FROM search_cache WHERE key = ?", (key,)).fetchone()
+            # Expired entries are still served in replay mode, there is nothing to refresh them with
+            if row is None or (self.mode != "replay" and time.time() - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.mode == "readwrite":
+                self._conn.execute("UPDATE search_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+        return json.loads(row[0])
+
+    def set(self, query: str, params: dict, result):
+        if self.mode != "readwrite":
+            return
+
+        key = self.make_key(query, params)
+        key_params = {k: v for k, v in params.items() if k != "api_key"}
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, query, params, result, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, query, json.dumps(key_params, sort_keys=True), json.dumps(result), now, now)
+            )
+            # Evict the least recently used entries beyond the size limit
+            count = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM search_cache WHERE key IN (SELECT key FROM search_cache ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    """
+    Return the process-wide search cache, configured from the environment:
+    SEARCH_CACHE_PATH, SEARCH_CACHE_TTL (seconds), SEARCH_CACHE_MAX_ENTRIES and SEARCH_CACHE_MODE.
+    """
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = SearchCache(
+                path=os.getenv("SEARCH_CACHE_PATH", DEFAULT_CACHE_PATH),
+                ttl=float(os.getenv("SEARCH_CACHE_TTL", 7 * 24 * 3600)),
+                max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 100000)),
+                mode=os.getenv("SEARCH_CACHE_MODE", "readwrite"),
+            )
+    return _search_cache
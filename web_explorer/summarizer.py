@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+from web_explorer.chunking import get_encoder, encode_paragraphs, split_into_chunks, bm25_scores
+
+# Longest page prefix (in tokens) worth chunking, only the most relevant chunks get summarized
+MAX_PAGE_TOKENS = 200000
+
+
+def select_relevant_chunks(topic: str, chunks: List[str], max_chunks: int = 8,
+                           scorer: Callable[[str, List[str]], List[float]] = bm25_scores) -> List[str]:
+    """
+    Keep the max_chunks chunks scoring highest for the topic, in page order.
+    Without a topic or without any matching chunk, the first max_chunks chunks are kept.
+    """
+    if not topic or len(chunks) <= max_chunks:
+        return chunks[:max_chunks]
+    scores = scorer(topic, chunks)
+    ranked = [i for i in sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True) if scores[i] > 0]
+    if not ranked:
+        return chunks[:max_chunks]
+    return [chunks[i] for i in sorted(ranked[:max_chunks])]
+
+
+def reduce_summaries(partial_summaries: List[str], summarize: Callable[[str], str], single_call_tokens: int = 20000,
+                     max_workers: int = 4, model: str = "gpt-4o") -> str:
+    """
+    Summarize partial summaries into one, without any call exceeding single_call_tokens.
+
+    While the partial summaries do not fit in a single call, consecutive ones are grouped into calls that
+    do and each group is summarized, so every round at least halves their number. A partial summary longer
+    than half a call is truncated so that it always shares its call with its neighbour.
+    """
+    encoder = get_encoder(model)
+    # Two truncated parts and their separators always fit in one call
+    part_tokens = single_call_tokens // 2 - 1
+    while True:
+        parts = [encoder.encode(f"Part {i + 1} of the page:\n{partial_summary}", disallowed_special=())
+                 for i, partial_summary in enumerate(partial_summaries)]
+        # Every part is followed by a one token separator
+        if sum(len(tokens) + 1 for tokens in parts) <= single_call_tokens:
+            return summarize("\n\n".join(encoder.decode(tokens) for tokens in parts))
+
+        groups, current, current_tokens = [], [], 0
+        for tokens in parts:
+            tokens = tokens[:part_tokens]
+            if current and current_tokens + len(tokens) + 1 > single_call_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(encoder.decode(tokens))
+            current_tokens += len(tokens) + 1
+        groups.append(current)
+        if len(groups) == 1:
+            return summarize("\n\n".join(groups[0]))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            partial_summaries = list(executor.map(summarize, ["\n\n".join(group) for group in groups]))
+
+
+def map_reduce_summarize(content: str, topic: str, summarize: Callable[[str], str], single_call_tokens: int = 20000,
+                         chunk_tokens: int = 4000, max_chunks: int = 8, max_workers: int = 4, model: str = "gpt-4o",
+                         scorer: Callable[[str, List[str]], List[float]] = bm25_scores) -> str:
+    """
+    Summarize content of any length with a single-call summarizer.
+
+    Content within single_call_tokens is summarized in one call. Longer content is split into chunks
+    of chunk_tokens tokens, the max_chunks chunks most relevant to the topic (lexical BM25 scores by
+    default, any scorer(topic, chunks) can be plugged in) are summarized concurrently, and the partial
+    summaries are reduced into the final summary with reduce_summaries.
+    """
+    # Short content: a single call (a token is at least one byte, so short content needs no encoding)
+    if len(content.encode("utf-8")) <= single_call_tokens:
+        return summarize(content)
+    # The page is encoded once, paragraph by paragraph, for both the length check and the chunking
+    paragraphs = encode_paragraphs(content, model)
+    if sum(len(tokens) for _, tokens in paragraphs) <= single_call_tokens:
+        return summarize(content)
+
+    chunks = select_relevant_chunks(topic, split_into_chunks(content, max_tokens=chunk_tokens, model=model, paragraphs=paragraphs), max_chunks, scorer)
+    if len(chunks) == 1:
+        return summarize(chunks[0])
+
+    # Map: summarize the relevant chunks concurrently
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        partial_summaries = list(executor.map(summarize, chunks))
+
+    # Reduce: summarize the partial summaries, in as many rounds as they need to fit in single calls
+    return reduce_summaries(partial_summaries, summarize, single_call_tokens, max_workers, model)
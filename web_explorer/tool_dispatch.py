@@ -0,0 +1,128 @@
+import json
+import asyncio
+from typing import List, Tuple
+
+from openai import OpenAI
+
+from web_explorer.utils import truncate_markdown, digest_web_content
+from web_explorer.summarizer import MAX_PAGE_TOKENS
+from web_explorer.search_api import get_text_search_results
+from web_explorer.visit_api import visit
+
+
+async def search_async(query: str):
+    return await asyncio.to_thread(get_text_search_results, query)
+
+
+async def visit_and_summarize_async(url: str, topic: str, qwen_client: OpenAI, max_tokens: int = MAX_PAGE_TOKENS,
+                                    visit_mode: str = "summarize"):
+    """
+    Fetch a page and summarize it for the topic (or extract its relevant passages) without blocking the event loop.
+    Returns (truncated page content, summary).
+    """
+    raw_content = await asyncio.to_thread(visit, url)
+    short_content = await asyncio.to_thread(truncate_markdown, raw_content, max_tokens)
+    web_summary = await asyncio.to_thread(digest_web_content, topic, short_content, qwen_client, visit_mode)
+    return short_content, web_summary
+
+
+async def dispatch_actions_async(actions: List[Tuple], default_topic: str, qwen_client: OpenAI, max_concurrency: int = 8,
+                                 visit_mode: str = "summarize"):
+    """
+    Run a list of search/visit actions concurrently.
+    Identical actions are only executed once. Results are returned in the order of the actions:
+    the search results for a search, and (page content, summary) for a visit.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    tasks = {}
+
+    async def run(action):
+        async with semaphore:
+            if action[0] == "search":
+                return await search_async(action[1])
+            topic = action[2] if len(action) > 2 and action[2] else default_topic
+            return await visit_and_summarize_async(action[1], topic, qwen_client, visit_mode=visit_mode)
+
+    for action in actions:
+        if action not in tasks:
+            tasks[action] = asyncio.ensure_future(run(action))
+
+    results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    results_by_action = dict(zip(tasks.keys(), results))
+    return [results_by_action[action] for action in actions]
+
+
+def dispatch_actions(actions: List[Tuple], default_topic: str, qwen_client: OpenAI, max_concurrency: int = 8,
+                     visit_mode: str = "summarize"):
+    """
+    Synchronous entry point of dispatch_actions_async for the step executors.
+    Failed actions are returned as their exception.
+    """
+    return asyncio.run(dispatch_actions_async(actions, default_topic, qwen_client, max_concurrency, visit_mode))
+
+
+def run_concurrent_actions(tool_actions: List[Tuple], default_topic: str, qwen_client: OpenAI, search_cache: dict,
+                           visit_cache: dict, actions: list, search_count: int, visit_count: int,
+                           max_searches: int, max_visits: int, visit_mode: str = "summarize") -> Tuple[str, int, int]:
+    """
+    Run the search/visit actions of one response concurrently and build the single user message answering them.
+    Searches already in search_cache are answered from it. Actions beyond max_searches/max_visits are reported
+    instead of executed and not counted. Every action is recorded in actions with its result.
+    Returns the user message and the updated search and visit counts.
+    """
+    to_dispatch = []
+    searches, visits = search_count, visit_count
+    for action in tool_actions:
+        if action[0] == "search":
+            searches += 1
+            if searches > max_searches or action[1] in search_cache:
+                continue
+        else:
+            visits += 1
+            if visits > max_visits:
+                continue
+        to_dispatch.append(action)
+    results = dict(zip(to_dispatch, dispatch_actions(to_dispatch, default_topic, qwen_client, visit_mode=visit_mode)))
+
+    user_prompt = ""
+    quota_reached = False
+    for action in tool_actions:
+        action_step = {"action": action[0], "param": action[1]}
+        if action[0] == "search":
+            if search_count >= max_searches:
+                quota_reached = True
+                result_string = "search quota reached"
+                user_prompt += f"Search quota reached for query: {action[1]}\n"
+            elif action not in results:
+                result_string = json.dumps(search_cache[action[1]], indent=2)
+                user_prompt += f"CACHED SEARCH ({action[1]}):\n```search_results\n{result_string}\n```\n"
+                search_count += 1
+            else:
+                search_results = results[action]
+                if isinstance(search_results, Exception):
+                    search_results = f"Search error: {search_results}"
+                search_cache[action[1]] = search_results
+                result_string = json.dumps(search_results, indent=2)
+                user_prompt += f"Search results for {action[1]}:\n```search_results\n{result_string}\n```\n"
+                search_count += 1
+        else:
+            if visit_count >= max_visits:
+                quota_reached = True
+                result_string = "visit quota reached"
+                user_prompt += f"Visit quota reached for: {action[1]}\n"
+            else:
+                visit_result = results[action]
+                if isinstance(visit_result, Exception):
+                    result_string = f"Website Visit Error: {visit_result}"
+                else:
+                    short_content, web_summary = visit_result
+                    visit_cache[action[1]] = short_content
+                    result_string = str(web_summary)
+                user_prompt += f"Here's a summary of {action[1]}:\n```web_content\n{result_string}\n```\n"
+                visit_count += 1
+        action_step["action_result"] = result_string
+        actions.append(action_step)
+
+    if quota_reached:
+        user_prompt += "Quota reached. Please provide a final answer using <answer>."
+    return user_prompt.strip(), search_count, visit_count
@@ -9,16 +9,22 @@ load_dotenv(dotenv_path=parent_env_path)
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 print(f"Using OpenRouter API Key: {OPENROUTER_API_KEY}")
 
+import re
 import json
 from openai import OpenAI
 
-import tiktoken
 import base64
 
 # from crawl4ai import AsyncWebCrawler
 # import asyncio
 
 from web_explorer.schemas import Plan, Step
+from llm.backends import chat_completion
+from web_explorer.visit_cache import get_visit_cache
+from web_explorer.chunking import get_encoder
+from web_explorer.summarizer import map_reduce_summarize
+from memory.embeddings import get_embedding_provider
+from web_explorer.passages import extract_relevant_passages
 
 # Function to encode the image
 def encode_image(image_path):
@@ -59,71 +65,137 @@ def extract_action(response: str):
         return ("no action detected", None)
 
 
-def truncate_markdown(markdown_text, max_tokens=20000, model="gpt-4o"):
+def extract_actions(response: str):
+    """
+    Extract every <search> and <visit> action of a response in order, for executors that run tool calls concurrently.
+    A <topic> directly following a <visit> belongs to that visit.
+    Responses with an <answer> or without any search/visit action fall back to extract_action.
+    """
+    if "<answer>" in response:
+        return [extract_action(response)]
+
+    actions = []
+    pattern = r"<search>(.*?)</search>|<visit>(.*?)</visit>(?:\s*<topic>(.*?)</topic>)?"
+    for match in re.finditer(pattern, response, re.DOTALL):
+        search_query, visit_link, topic = match.groups()
+        if search_query is not None:
+            actions.append(("search", search_query))
+        else:
+            actions.append(("visit", visit_link, topic))
+
+    if not actions:
+        return [extract_action(response)]
+    return actions
+
+
+def truncate_markdown(markdown_text, max_tokens=20000, model="gpt-4o", chunk_chars=65536):
     """
     Truncates the markdown content to fit within a max token limit for a given GPT model.
 
+    Texts whose UTF-8 length is within max_tokens are returned without encoding (a token covers
+    at least one byte). Longer texts are encoded line-aligned chunk by chunk, stopping at the chunk
+    that reaches max_tokens, so only the kept part of a large page is ever encoded.
+
     Parameters:
         markdown_text (str): Full markdown content to truncate.
-        max_tokens (int): Maximum number of tokens allowed (default: 8000).
+        max_tokens (int): Maximum number of tokens allowed (default: 20000).
         model (str): The model name for tiktoken tokenizer (e.g., 'gpt-4o').
+        chunk_chars (int): Number of characters encoded at a time.
 
     Returns:
         str: Truncated markdown content.
     """
-    # Load the appropriate tokenizer
-    enc = tiktoken.encoding_for_model(model)
-
-    # Tokenize the entire input
-    tokens = enc.encode(markdown_text)
-
-    if len(tokens) <= max_tokens:
+    # Fast path: obviously below the limit
+    if len(markdown_text) <= max_tokens and len(markdown_text.encode("utf-8")) <= max_tokens:
+        return markdown_text
+
+    enc = get_encoder(model)
+
+    kept = []
+    token_count = 0
+    position = 0
+    while position < len(markdown_text):
+        end = min(position + chunk_chars, len(markdown_text))
+        if end < len(markdown_text):
+            # Cut chunks at line ends so no token straddles two chunks
+            line_end = markdown_text.rfind("\n", position, end)
+            if line_end > position:
+                end = line_end + 1
+        chunk = markdown_text[position:end]
+        tokens = enc.encode(chunk, disallowed_special=())
+        if token_count + len(tokens) > max_tokens:
+            kept.append(enc.decode(tokens[:max_tokens - token_count]))
+            break
+        kept.append(chunk)
+        token_count += len(tokens)
+        position = end
+    else:
         return markdown_text  # No truncation needed
 
-    # Truncate and decode back to string
-    truncated = enc.decode(tokens[:max_tokens])
-    
-    # Optionally: make a cleaner cut (e.g., end at paragraph or sentence)
+    truncated = "".join(kept)
+
+    # Make a cleaner cut at the end of the last complete paragraph
     last_paragraph_end = truncated.rfind("\n\n")
     if last_paragraph_end != -1:
         truncated = truncated[:last_paragraph_end] + "\n\n*...(truncated)*"
 
     return truncated
 
-def summarize_web_content_by_qwen(topic, web_content, openrouter_client):
+def summarize_web_content_by_qwen(topic, web_content, openrouter_client, model="qwen/qwen3-235b-a22b:free"):
     """
     Summarizes web content using Qwen model.
+    Pages longer than 20k tokens are summarized by map-reduce over their chunks most relevant to the topic.
+    Summaries are cached by (content hash, topic, model), so revisiting a page for the same topic is free.
 
     Parameters:
         web_content (str): The content to summarize.
-        openrouter_client: Optional client for OpenRouter API.
+        openrouter_client: OpenAI client for the OpenRouter API, or an LLMBackend.
+        model (str): The summarizer model.
 
     Returns:
         str: Summary of the web content.
     """
-    # Placeholder for Qwen summarization logic
-    # This should be replaced with actual Qwen API call or logic
+    visit_cache = get_visit_cache()
+    cached_summary = visit_cache.get_summary(web_content, topic, model)
+    if cached_summary is not None:
+        return cached_summary
 
-    summarize_prompt = f"""Summarize the webpage content relevant to the topic '{topic}'. Also, extract any relevant links or buttons that can be used to navigate or perform actions on the webpage.
+    def summarize_once(content):
+        summarize_prompt = f"""Summarize the webpage content relevant to the topic '{topic}'. Also, extract any relevant links or buttons that can be used to navigate or perform actions on the webpage.
 ```web_content
-{web_content}
+{content}
 ```
 """
-    response = openrouter_client.chat.completions.create(
-        model="qwen/qwen3-235b-a22b:free",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant to summarize webpage content relevant to the given topic."},
-            {"role": "user", "content": summarize_prompt}
-        ],
-        max_tokens=5000,  # Adjust as needed
-    )
-    # return response # debug
-    res = response.choices[0].message.content
-    if '</think>' in res:
-        return res.split('</think>')[-1]
-    else:
+        res = chat_completion(
+            openrouter_client,
+            model=model,
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant to summarize webpage content relevant to the given topic."},
+                {"role": "user", "content": summarize_prompt}
+            ],
+            max_tokens=5000,  # Adjust as needed
+        )
+        if '</think>' in res:
+            res = res.split('</think>')[-1]
         return res
 
+    # Long pages are summarized chunk by chunk, see map_reduce_summarize
+    res = map_reduce_summarize(web_content, topic, summarize_once)
+    visit_cache.set_summary(web_content, topic, model, res)
+    return res
+
+def digest_web_content(topic, web_content, openrouter_client, visit_mode="summarize"):
+    """
+    What the agent gets back from a visit: an LLM summary of the page relevant to the topic ("summarize"),
+    or the passages of the page ranked most relevant to the topic with their links, without any LLM call
+    ("extract" ranks them with BM25, "rerank" also reranks the best BM25 passages with sentence embeddings).
+    """
+    if visit_mode == "extract":
+        return extract_relevant_passages(topic, web_content)
+    if visit_mode == "rerank":
+        return extract_relevant_passages(topic, web_content, embed_fn=get_embedding_provider().encode)
+    return summarize_web_content_by_qwen(topic, web_content, openrouter_client)
+
 def load_plan(plan_path: str):
     # Read from file
     with open(plan_path, "r", encoding="utf-8") as f:
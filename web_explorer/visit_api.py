@@ -4,6 +4,9 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
+from web_explorer.visit_cache import get_visit_cache
+from web_explorer.http_transport import get_transport, CircuitOpenError
+
 # Get the path to the parent folder
 parent_env_path = Path(__file__).resolve().parents[1] / ".env"
 
@@ -13,10 +16,28 @@ load_dotenv(dotenv_path=parent_env_path)
 API_KEY = os.getenv("JINA_API_KEY")
 
 def visit(url: str):
+    # Serve fresh pages from the shared cache, revalidate stale ones
+    visit_cache = get_visit_cache()
+    cached_page = visit_cache.get_page(url)
+    if cached_page and visit_cache.is_fresh(cached_page):
+        return cached_page.content
+
     request_url = "https://r.jina.ai/" + url
     headers = {"Authorization": f"Bearer {API_KEY}"}
-    response = requests.get(request_url, headers=headers)
+    if cached_page:
+        if cached_page.etag:
+            headers["If-None-Match"] = cached_page.etag
+        if cached_page.last_modified:
+            headers["If-Modified-Since"] = cached_page.last_modified
+    try:
+        response = get_transport().get(request_url, target_url=url, headers=headers)
+    except (requests.RequestException, CircuitOpenError) as e:
+        return f"Website Visit Error: {e}"
+    if response.status_code == 304 and cached_page:
+        visit_cache.touch_page(url)
+        return cached_page.content
     if response.status_code == 200:
+        visit_cache.set_page(url, response.text, etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"))
         return response.text
     else:
         return f"Website Visit Error: {response.status_code}"
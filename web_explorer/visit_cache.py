@@ -0,0 +1,190 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from dotenv import load_dotenv
+
+# Get the path to the parent folder
+parent_env_path = Path(__file__).resolve().parents[1] / ".env"
+
+# Load the .env file from the parent folder
+load_dotenv(dotenv_path=parent_env_path)
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parents[1] / "cache" / "visit_cache.sqlite"
+
+# Query parameters that only track the visitor and never change the page content
+TRACKING_PARAMS = ("utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content", "gclid", "fbclid")
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Canonicalize a URL so that trivially different spellings of the same page share a cache entry:
+    lowercase scheme and host, default ports, fragments and tracking parameters removed,
+    query parameters sorted.
+    """
+    url = url.strip()
+    parts = urlsplit(url if "://" in url else "https://" + url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    path = parts.path or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path[:-1]
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in TRACKING_PARAMS))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class CachedPage:
+    def __init__(self, content: str, etag: str, last_modified: str, fetched_at: float):
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+
+class VisitCache:
+    """
+    Two-tier persistent cache for visited web pages.
+
+    - pages: raw page markdown keyed by canonicalized URL, stored zlib-compressed together with
+      the ETag/Last-Modified validators of the response. Pages younger than ttl are served
+      directly, older ones are revalidated with a conditional request by the caller.
+    - summaries: page summaries keyed by (content hash, topic, summarizer model), so a repeated
+      visit with the same topic never pays for a second summarization.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = 24 * 3600, mode: str = "readwrite"):
+        if mode not in ["readwrite", "off"]:
+            raise ValueError(f"Unknown visit cache mode: {mode}, must be one of ['readwrite', 'off']")
+        self.path = Path(path)
+        self.ttl = ttl
+        self.mode = mode
+        self.page_hits = 0
+        self.page_misses = 0
+        self.summary_hits = 0
+        self.summary_misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if self.mode != "off":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "url TEXT PRIMARY KEY, content BLOB, etag TEXT, last_modified TEXT, fetched_at REAL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "key TEXT PRIMARY KEY, summary BLOB, created_at REAL)"
+            )
+            self._conn.commit()
+
+    def get_page(self, url: str):
+        """
+        Return the cached page for a URL (possibly stale, see is_fresh), or None.
+        """
+        if self.mode == "off":
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, etag, last_modified, fetched_at FROM pages WHERE url = ?", (canonicalize_url(url),)
+            ).fetchone()
+        if row is None:
+            self.page_misses += 1
+            return None
+        self.page_hits += 1
+        return CachedPage(zlib.decompress(row[0]).decode("utf-8"), row[1], row[2], row[3])
+
+    def is_fresh(self, page: CachedPage) -> bool:
+        return time.time() - page.fetched_at <= self.ttl
+
+    def set_page(self, url: str, content: str, etag: str = None, last_modified: str = None):
+        if self.mode == "off":
+            return
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, content, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (canonicalize_url(url), zlib.compress(content.encode("utf-8")), etag, last_modified, time.time())
+            )
+            self._conn.commit()
+
+    def touch_page(self, url: str):
+        """
+        Mark a cached page as fresh after a successful revalidation (304 Not Modified).
+        """
+        if self.mode == "off":
+            return
+
+        with self._lock:
+            self._conn.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), canonicalize_url(url)))
+            self._conn.commit()
+
+    @staticmethod
+    def make_summary_key(content: str, topic: str, model: str) -> str:
+        return hashlib.sha256(f"{content_hash(content)}\n{topic.strip()}\n{model}".encode("utf-8")).hexdigest()
+
+    def get_summary(self, content: str, topic: str, model: str):
+        if self.mode == "off":
+            return None
+
+        key = self.make_summary_key(content, topic, model)
+        with self._lock:
+            row = self._conn.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.summary_misses += 1
+            return None
+        self.summary_hits += 1
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def set_summary(self, content: str, topic: str, model: str, summary: str):
+        if self.mode == "off":
+            return
+
+        key = self.make_summary_key(content, topic, model)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, created_at) VALUES (?, ?, ?)",
+                (key, zlib.compress(summary.encode("utf-8")), time.time())
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        return {
+            "page_hits": self.page_hits,
+            "page_misses": self.page_misses,
+            "summary_hits": self.summary_hits,
+            "summary_misses": self.summary_misses,
+        }
+
+
+_visit_cache = None
+_visit_cache_lock = threading.Lock()
+
+
+def get_visit_cache() -> VisitCache:
+    """
+    Return the process-wide visit cache, configured from the environment:
+    VISIT_CACHE_PATH, VISIT_CACHE_TTL (seconds) and VISIT_CACHE_MODE.
+    """
+    global _visit_cache
+    with _visit_cache_lock:
+        if _visit_cache is None:
+            _visit_cache = VisitCache(
+                path=os.getenv("VISIT_CACHE_PATH", DEFAULT_CACHE_PATH),
+                ttl=float(os.getenv("VISIT_CACHE_TTL", 24 * 3600)),
+                mode=os.getenv("VISIT_CACHE_MODE", "readwrite"),
+            )
+    return _visit_cache